@@ -0,0 +1,66 @@
+# encoding: utf-8
+"""
+Time CArchiveReader.iter_cookies() on a binary whose archive is followed
+by a large overlay (a code signature, appended data), and report the
+peak memory of the scan.
+
+    python benchmarks/bench_cookie.py --overlay 1024 -c 64 1024 16384
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unfreezePy.extractor.app.pyinstaller.readers import CArchiveReader
+
+import synthetic
+
+
+def peak_rss():
+    if resource is None:
+        return 0
+    # KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--overlay', default=1024, type=int, help='MB of data after the archive')
+    parser.add_argument('--archives', default=2, type=int, help='archives concatenated before the overlay')
+    parser.add_argument('-c', '--chunks', default=[64, 1024, 16384], type=int, nargs='+', help='scan block sizes in KB')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".exe")
+    os.close(fd)
+    try:
+        items = [('z', 'PYZ-00.pyz', synthetic.pyz_data(100, 1024), False),
+                 ('x', 'data.bin', os.urandom(1 << 20), False)]
+        with open(path, "wb") as f:
+            f.write(b"MZ" + b"\0" * 4094)
+            for _ in range(args.archives):
+                f.write(synthetic.carchive_data(items))
+            f.seek(args.overlay * (1 << 20) - 1, 1)
+            f.write(b"\0")
+            size = f.tell()
+        print("%.1f MB file, %d archives, %d MB overlay" % (size / 1e6, args.archives, args.overlay))
+        print("%10s %10s %10s %10s %12s" % ("chunk KB", "seconds", "MB/s", "found", "peak RSS MB"))
+        for chunk in args.chunks:
+            start = time.time()
+            found = len(CArchiveReader.find_archives(path, chunk * 1024))
+            elapsed = time.time() - start
+            print("%10d %10.3f %10.0f %10d %12.1f" % (chunk, elapsed, size / 1e6 / elapsed, found, peak_rss()))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# encoding: utf-8
+"""
+Throughput of CArchiveReader.iter_extract() over a synthetic application
+with an encrypted PYZ, for different numbers of decrypt worker
+processes. The key is not given, the reader finds it in the bundled
+pyimod00_crypto_key module.
+
+    python benchmarks/bench_decrypt.py -n 5000 -p 1 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unfreezePy.extractor.app.pyinstaller.readers import CArchiveReader
+
+import synthetic
+
+
+def run(path, processes, threads, use_mmap):
+    start = time.time()
+    reader = CArchiveReader(path, use_mmap=use_mmap, threads=threads, processes=processes)
+    assert reader.key, "no key found in the archive"
+    count = size = 0
+    for typ, name, data in reader.iter_extract():
+        count += 1
+        size += len(data)
+    return count, size, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--entries', default=5000, type=int, help='modules in the PYZ')
+    parser.add_argument('-s', '--size', default=8192, type=int, help='source size of a module')
+    parser.add_argument('-k', '--key', default="0123456789abcdef", help='key the PYZ is encrypted with')
+    parser.add_argument('-p', '--processes', default=[1, 2, 4, 8], type=int, nargs='+')
+    parser.add_argument('-z', '--threads', default=1, type=int, help='decompression threads without processes')
+    parser.add_argument('-m', '--mmap', default=False, action='store_true', dest='use_mmap')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".exe")
+    os.close(fd)
+    try:
+        archive_size = synthetic.build_app(path, args.entries, args.size, key=args.key)
+        print("%d encrypted entries, %.1f MB archive" % (args.entries, archive_size / 1e6))
+        print("%9s %10s %12s %10s %8s" % ("processes", "seconds", "entries/s", "MB/s", "speedup"))
+        base = None
+        for processes in args.processes:
+            count, size, elapsed = run(path, processes, args.threads, args.use_mmap)
+            base = base or elapsed
+            print("%9d %10.3f %12.0f %10.1f %7.2fx" % (processes, elapsed, count / elapsed,
+                                                       size / 1e6 / elapsed, base / elapsed))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
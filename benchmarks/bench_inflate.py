@@ -0,0 +1,57 @@
+# encoding: utf-8
+"""
+Throughput of ZlibArchiveReader.iter_extract() over a synthetic PYZ for
+different numbers of decompression threads.
+
+    python benchmarks/bench_inflate.py -n 20000 -t 1 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unfreezePy.extractor.app.pyinstaller.readers import ZlibArchiveReader
+
+import synthetic
+
+
+def run(path, threads, use_mmap):
+    start = time.time()
+    reader = ZlibArchiveReader(path, pyver=synthetic.PYVER, use_mmap=use_mmap, threads=threads)
+    count = size = 0
+    for typ, name, data in reader.iter_extract():
+        count += 1
+        size += len(data)
+    return count, size, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--entries', default=10000, type=int, help='modules in the PYZ')
+    parser.add_argument('-s', '--size', default=8192, type=int, help='source size of a module')
+    parser.add_argument('-t', '--threads', default=[1, 2, 4, 8], type=int, nargs='+')
+    parser.add_argument('-m', '--mmap', default=False, action='store_true', dest='use_mmap')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".pyz")
+    os.close(fd)
+    try:
+        archive_size = synthetic.build_pyz(path, args.entries, args.size)
+        print("%d entries, %.1f MB compressed" % (args.entries, archive_size / 1e6))
+        print("%8s %10s %12s %10s %8s" % ("threads", "seconds", "entries/s", "MB/s", "speedup"))
+        base = None
+        for threads in args.threads:
+            count, size, elapsed = run(path, threads, args.use_mmap)
+            base = base or elapsed
+            print("%8d %10.3f %12.0f %10.1f %7.2fx" % (threads, elapsed, count / elapsed,
+                                                       size / 1e6 / elapsed, base / elapsed))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# encoding: utf-8
+"""
+Tail latency of the decompile workers with the modules handed out in
+directory order and largest first, over a set of .pyc files with a few
+big modules among many small ones. The big ones sort last, as they
+would in an unlucky os.walk() order.
+
+    python benchmarks/bench_schedule.py -n 400 --big 4 -j 8
+    python benchmarks/bench_schedule.py --simulate 2    # sleep 1s per 2 MB instead of decompiling
+
+The tail is the time the run takes beyond a perfect split of the work
+over the workers.
+"""
+
+import argparse
+import os
+import py_compile
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unfreezePy.extractor.extractor import _decompile_job, default_handle_decompile, pyc_cost
+from unfreezePy.extractor.workers import WorkerPool, largest_first
+
+import synthetic
+
+
+def build_pycs(directory, count, size, big, big_size):
+    """
+    Write count modules of size bytes of source and big of big_size as
+    .pyc files, the big ones last by name.
+    """
+    files = []
+    for i in range(count + big):
+        name = "mod%05d" % i if i < count else "zz_big%03d" % i
+        source = os.path.join(directory, name + ".py")
+        with open(source, "w") as f:
+            f.write(synthetic.module_source(i, size if i < count else big_size))
+        files.append(source + "c")
+        py_compile.compile(source, cfile=files[-1], doraise=True)
+        os.remove(source)
+    return files
+
+
+def _simulated_job(job):
+    # stands in for _decompile_job(): as long as the module is big
+    handle_decompile, file, rate = job
+    time.sleep(pyc_cost(file) / (rate * 1e6))
+    return file, None
+
+
+def run(files, order, workers, rate):
+    files = largest_first(files, pyc_cost) if order == "largest" else sorted(files)
+    if rate:
+        func, jobs = _simulated_job, [(None, x, rate) for x in files]
+    else:
+        func, jobs = _decompile_job, [(default_handle_decompile, x, True, None) for x in files]
+    busy = []
+    start = time.time()
+    done = []
+    pool = WorkerPool(func, workers, on_done=lambda job, result, seconds: busy.append(seconds))
+    for _ in pool.imap_unordered(jobs):
+        done.append(time.time() - start)
+    elapsed = time.time() - start
+    done.sort()
+    return {
+        "seconds": elapsed,
+        "p50": done[len(done) // 2],
+        "p99": done[min(len(done) - 1, int(len(done) * 0.99))],
+        "tail": elapsed - sum(busy) / workers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--modules', default=400, type=int, help='small modules')
+    parser.add_argument('-s', '--size', default=4096, type=int, help='source size of a small module')
+    parser.add_argument('--big', default=4, type=int, help='big modules')
+    parser.add_argument('--big-size', default=2 << 20, type=int, dest='big_size', help='source size of a big one')
+    parser.add_argument('-j', '--jobs', default=4, type=int, dest='workers', help='decompile workers')
+    parser.add_argument('--simulate', default=None, type=float, metavar='MBPS',
+                        help='sleep for the size of a module at this rate instead of decompiling it')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        files = build_pycs(directory, args.modules, args.size, args.big, args.big_size)
+        print("%d modules, %d big ones, %.1f MB of .pyc, %d workers" % (
+            len(files), args.big, sum(pyc_cost(x) for x in files) / 1e6, args.workers))
+        print("%-10s %10s %10s %10s %10s" % ("order", "seconds", "p50", "p99", "tail"))
+        for order in ("directory", "largest"):
+            result = run(files, order, args.workers, args.simulate)
+            print("%-10s %10.3f %10.3f %10.3f %10.3f" % (order, result["seconds"], result["p50"], result["p99"],
+                                                         result["tail"]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
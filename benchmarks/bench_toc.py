@@ -0,0 +1,130 @@
+# encoding: utf-8
+"""
+Time the loading of large TOCs: the CArchive TOC parsed the way it used
+to be (two struct.unpack() and slices per entry), with the precompiled
+struct from a string and from a mapping, and into a CompactToc; and the
+marshalled TOC of a PYZ read from a file and from a mapping.
+
+    python benchmarks/bench_toc.py -n 100000 -r 5
+
+The memory column is the size of the parsed TOC without the names, which
+both representations share.
+"""
+
+import argparse
+import imp
+import marshal
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unfreezePy.extractor.app.pyinstaller import utils
+from unfreezePy.extractor.app.pyinstaller.readers import CArchiveReader, CompactToc, ZlibArchiveReader
+
+import synthetic
+
+
+def legacy_toc_read(s):
+    # toc_read_from_binary() as it was, the baseline
+    ENTRYSTRUCT = '!iiiiBB'
+    ENTRYLEN = struct.calcsize(ENTRYSTRUCT)
+    p = 0
+    toc = []
+    while p < len(s):
+        (slen, dpos, dlen, ulen, flag, typcd) = struct.unpack(ENTRYSTRUCT, s[p:p + ENTRYLEN])
+        nmlen = slen - ENTRYLEN
+        p = p + ENTRYLEN
+        (nm,) = struct.unpack('%is' % nmlen, s[p:p + nmlen])
+        p = p + nmlen
+        nm = nm.rstrip(b'\0')
+        nm = nm.decode('utf-8')
+        typcd = chr(typcd)
+        toc.append((dpos, dlen, ulen, flag, typcd, nm))
+    return toc
+
+
+def carchive_toc(entries):
+    """
+    The binary TOC of a CArchive with entries modules, the way
+    synthetic.carchive_data() lays it out.
+    """
+    toc = []
+    pos = 0
+    for i in range(entries):
+        nm = ("pkg%03d.mod%06d" % (i % 997, i)).encode("utf-8") + b"\0"
+        nm += b"\0" * (-(synthetic.TOC_ENTRY.size + len(nm)) % 16)
+        toc.append(synthetic.TOC_ENTRY.pack(synthetic.TOC_ENTRY.size + len(nm), pos, 1000, 3000, 1, ord('m')) + nm)
+        pos += 1000
+    return b"".join(toc)
+
+
+def pyz_toc(entries):
+    """
+    A PYZ holding no data, only the marshalled TOC of entries modules.
+    """
+    toc = [("pkg%03d.mod%06d" % (i % 997, i), (0, 17 + i * 1000, 1000)) for i in range(entries)]
+    return b"PYZ\0" + imp.get_magic() + struct.pack("!i", 12) + marshal.dumps(toc)
+
+
+def toc_size(toc):
+    # the parsed entries without their names
+    if isinstance(toc, CompactToc):
+        arrays = (toc.dpos, toc.dlen, toc.ulen)
+        return sum(x.itemsize * len(x) for x in arrays) + len(toc.flags) + len(toc.typcds) + \
+            sys.getsizeof(toc.names)
+    return sys.getsizeof(toc) + sum(sys.getsizeof(entry) + sum(sys.getsizeof(x) for x in entry[:5])
+                                    for entry in toc)
+
+
+def best(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--entries', default=100000, type=int, help='TOC entries')
+    parser.add_argument('-r', '--repeat', default=5, type=int, help='runs per variant, the best one counts')
+    args = parser.parse_args()
+
+    tocstr = carchive_toc(args.entries)
+    fd, path = tempfile.mkstemp(suffix=".pyz")
+    os.close(fd)
+    try:
+        with open(path, "wb") as f:
+            f.write(pyz_toc(args.entries))
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = utils.buffer_view(tocstr)
+
+        variants = [
+            ("carchive legacy", lambda: legacy_toc_read(tocstr)),
+            ("carchive", lambda: CArchiveReader.toc_read_from_binary(tocstr)),
+            ("carchive view", lambda: CArchiveReader.toc_read_from_binary(view)),
+            ("carchive compact", lambda: CArchiveReader.toc_read_from_binary(tocstr, compact=True)),
+            ("pyz file", lambda: ZlibArchiveReader(path).toc),
+            ("pyz mmap", lambda: ZlibArchiveReader(path, mapping=mapping).toc),
+        ]
+        print("%d entries, %.1f MB CArchive TOC, %.1f MB PYZ" % (args.entries, len(tocstr) / 1e6,
+                                                                 os.path.getsize(path) / 1e6))
+        print("%-18s %10s %12s %12s" % ("variant", "seconds", "entries/s", "memory MB"))
+        for name, func in variants:
+            seconds, toc = best(func, args.repeat)
+            memory = "%12.1f" % (toc_size(toc) / 1e6) if name.startswith("carchive") else "%12s" % "-"
+            print("%-18s %10.3f %12.0f %s" % (name, seconds, len(toc) / seconds, memory))
+        mapping.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
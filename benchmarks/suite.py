@@ -0,0 +1,251 @@
+# encoding: utf-8
+"""
+Benchmark suite over a synthetic frozen application (see synthetic.py):
+TOC parse time, extraction throughput and end-to-end unfreeze time of
+unfreezePy and unpyinstaller.py, each with its peak memory.
+
+Every stage runs in a fresh interpreter, so the peak RSS of one stage is
+not hidden by an earlier one. The suite runs on python 2 like the
+readers; unpyinstaller.py needs python 3 and PyInstaller, its stage runs
+with the interpreter --py3 names, on an app built by that interpreter.
+
+    python benchmarks/suite.py -n 5000 --key secret --nested 1
+    python benchmarks/suite.py --stages toc extract --json results.json
+    python benchmarks/suite.py --py3 /usr/bin/python3.6
+
+A stage that fails, a tool exiting with an error included, is reported
+as failed and the suite exits with status 1.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import synthetic
+
+STAGES = ("toc", "extract", "unfreezePy", "unpyinstaller")
+
+
+class StageError(Exception):
+    pass
+
+
+def peak_rss(who=None):
+    if resource is None:
+        return 0
+    # KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss / 1024.0
+
+
+def _reader(path, args):
+    from unfreezePy.extractor.app.pyinstaller.readers import CArchiveReader
+    return CArchiveReader(path, key=args.key, use_mmap=args.use_mmap, threads=args.threads)
+
+
+def stage_toc(path, args):
+    start = time.time()
+    count = len(list(_reader(path, args).iter_toc()))
+    return {"seconds": time.time() - start, "entries": count}
+
+
+def stage_extract(path, args):
+    start = time.time()
+    count = size = 0
+    for typcd, name, data in _reader(path, args).iter_extract():
+        count += 1
+        size += len(data)
+    return {"seconds": time.time() - start, "entries": count, "bytes": size}
+
+
+def _last_line(output):
+    lines = output.decode("utf-8", "replace").strip().splitlines()
+    return lines[-1] if lines else ""
+
+
+def _run_tool(cmd):
+    start = time.time()
+    with open(os.devnull, "w") as devnull:
+        process = subprocess.Popen(cmd, stdout=devnull, stderr=subprocess.PIPE)
+        _, err = process.communicate()
+    if process.returncode:
+        raise StageError("%s exited with code %d: %s" % (os.path.basename(cmd[1]), process.returncode,
+                                                         _last_line(err)))
+    return {"seconds": time.time() - start, "peak_rss": peak_rss(resource and resource.RUSAGE_CHILDREN)}
+
+
+def _count_sources(directory):
+    return sum(len([x for x in files if x.endswith(".py")]) for root, dirs, files in os.walk(directory))
+
+
+def stage_unfreezePy(path, args):
+    outputdir = tempfile.mkdtemp()
+    try:
+        cmd = [sys.executable, os.path.join(ROOT, "unfreezePy", "unfreezePy.py"), "-o", outputdir,
+               "-z", str(args.threads), "-k", args.key, path]
+        if args.workers:
+            cmd[2:2] = ["-j", str(args.workers)]
+        result = _run_tool(cmd)
+        result["entries"] = _count_sources(outputdir)
+        return result
+    finally:
+        shutil.rmtree(outputdir, ignore_errors=True)
+
+
+def stage_unpyinstaller(path, args):
+    if not args.py3:
+        raise StageError("unpyinstaller.py needs a python 3 interpreter with PyInstaller, see --py3")
+    outputdir = tempfile.mkdtemp()
+    try:
+        cmd = [args.py3, os.path.join(ROOT, "unpyinstaller.py"), "-s", "-v", args.pyver,
+               "-o", os.path.join(outputdir, "out"), path]
+        result = _run_tool(cmd)
+        result["entries"] = _count_sources(outputdir)
+        return result
+    finally:
+        shutil.rmtree(outputdir, ignore_errors=True)
+
+
+def run_stage(stage, path, args):
+    result = globals()["stage_" + stage](path, args)
+    result.setdefault("peak_rss", peak_rss())
+    return result
+
+
+def spawn_stage(stage, path, argv):
+    """
+    Run stage in a fresh interpreter, returns its result dict. Raises a
+    StageError if it fails.
+    """
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--stage", stage, "--archive", path] +
+                               argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    if process.returncode:
+        raise StageError(_last_line(err) or "exit code %d" % process.returncode)
+    return json.loads(_last_line(out))
+
+
+def build_app(path, args, python=None):
+    """
+    Write the synthetic app of the options args to path, with its
+    bytecode compiled by the interpreter python, this one by default.
+    Returns the file size and the python version ("27").
+    """
+    params = [path, args.modules, args.size, args.level, args.key, args.data_entries, args.data_size,
+              args.compress, args.nested]
+    if python is None:
+        return synthetic.build_app(*params), synthetic.PYVER
+    code = ("import json, sys; sys.path.insert(0, %r); import synthetic; "
+            "print(json.dumps([synthetic.build_app(*json.loads(sys.argv[1])), synthetic.PYVER]))" % HERE)
+    output = subprocess.check_output([python, "-c", code, json.dumps(params)])
+    return tuple(json.loads(_last_line(output)))
+
+
+def get_argparse():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--modules', default=2000, type=int, help='modules in the PYZ')
+    parser.add_argument('-s', '--size', default=4096, type=int, help='source size of a module')
+    parser.add_argument('-l', '--level', default=6, type=int, help='zlib level of the PYZ entries')
+    parser.add_argument('-k', '--key', default="", help='encrypt the PYZ with this key')
+    parser.add_argument('-d', '--data-entries', default=100, type=int, dest='data_entries',
+                        help='data files in the CArchive')
+    parser.add_argument('--data-size', default=65536, type=int, dest='data_size', help='size of a data file')
+    parser.add_argument('--stored', default=True, action='store_false', dest='compress',
+                        help='store CArchive entries uncompressed')
+    parser.add_argument('--nested', default=0, type=int, help='levels of embedded CArchives')
+    parser.add_argument('-z', '--threads', default=1, type=int, help='decompression threads')
+    parser.add_argument('-j', '--jobs', default=None, type=int, dest='workers', help='decompile workers')
+    parser.add_argument('-m', '--mmap', default=False, action='store_true', dest='use_mmap')
+    parser.add_argument('--stages', default=list(STAGES), nargs='+', choices=STAGES)
+    parser.add_argument('--repeat', default=1, type=int, help='runs per stage, the best is reported')
+    parser.add_argument('--json', default=None, dest='json', help='also write the results to this file')
+    parser.add_argument('--py3', default=None, metavar='PYTHON',
+                        help='python 3 interpreter with PyInstaller to run unpyinstaller.py with')
+    # internal: run one stage on an existing archive
+    parser.add_argument('--stage', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--archive', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--pyver', default=synthetic.PYVER, help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    parser = get_argparse()
+    args = parser.parse_args()
+    if args.stage:
+        try:
+            result = run_stage(args.stage, args.archive, args)
+        except StageError as e:
+            sys.stderr.write("%s\n" % e)
+            return 1
+        sys.stdout.write(json.dumps(result) + "\n")
+        return 0
+
+    # the options the stages need, passed on to the stage interpreters
+    argv = ["-z", str(args.threads), "-k", args.key]
+    if args.workers:
+        argv += ["-j", str(args.workers)]
+    if args.use_mmap:
+        argv.append("-m")
+    if args.py3:
+        argv += ["--py3", args.py3]
+
+    paths = []
+    for suffix in (".exe", "-py3.exe"):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        paths.append(path)
+    path, py3_path = paths
+    failed = []
+    try:
+        size, _ = build_app(path, args)
+        # the app of the unpyinstaller stage holds bytecode of the interpreter it runs with
+        stage_paths = dict((stage, path) for stage in args.stages)
+        if "unpyinstaller" in args.stages and args.py3:
+            _, py3_pyver = build_app(py3_path, args, args.py3)
+            stage_paths["unpyinstaller"] = py3_path
+            argv += ["--pyver", py3_pyver]
+        print("%.1f MB archive, %d modules, %d data files, nesting %d%s" % (
+            size / 1e6, args.modules, args.data_entries, args.nested, ", encrypted" if args.key else ""))
+        print("%-14s %10s %10s %12s %10s %12s" % ("stage", "seconds", "entries", "entries/s", "MB/s",
+                                                  "peak RSS MB"))
+        results = {}
+        for stage in args.stages:
+            try:
+                runs = [spawn_stage(stage, stage_paths[stage], argv) for _ in range(args.repeat)]
+            except StageError as e:
+                failed.append(stage)
+                results[stage] = {"error": str(e)}
+                print("%-14s failed: %s" % (stage, e))
+                continue
+            result = min(runs, key=lambda x: x["seconds"])
+            results[stage] = result
+            seconds = result["seconds"]
+            mbps = "%10.1f" % (result["bytes"] / 1e6 / seconds) if "bytes" in result else "%10s" % "-"
+            line = "%-14s %10.3f %10d %12.0f %s %12.1f" % (stage, seconds, result["entries"],
+                                                          result["entries"] / seconds, mbps, result["peak_rss"])
+            print(line)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"archive_size": size, "options": vars(args), "results": results}, f, indent=2,
+                          sort_keys=True)
+    finally:
+        for path in paths:
+            os.remove(path)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
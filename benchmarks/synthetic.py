@@ -0,0 +1,160 @@
+# encoding: utf-8
+"""
+Build synthetic PyInstaller archives in the layout the readers in
+unfreezePy/extractor/app/pyinstaller/readers.py parse, for benchmarks.
+"""
+
+import imp
+import marshal
+import os
+import struct
+import sys
+import zlib
+
+import Crypto.Cipher.AES
+
+
+PYVER = "%d%d" % sys.version_info[:2]
+
+# see CArchiveReader
+TOC_ENTRY = struct.Struct("!iiiiBB")
+COOKIE = struct.Struct("!8siiii64s")
+# see Cipher
+CRYPT_BLOCK_SIZE = 16
+
+
+def module_source(index, size):
+    """
+    Python source of roughly size bytes, distinct for every index.
+    """
+    lines = ["# synthetic module %d" % index, "TABLE = {"]
+    n = 0
+    while sum(len(x) for x in lines) < size:
+        lines.append("    'key_%d_%d': %d," % (index, n, n * index))
+        n += 1
+    lines.append("}")
+    lines.append("def lookup(key):\n    return TABLE.get(key, %d)" % index)
+    return "\n".join(lines) + "\n"
+
+
+def module_code(index, size, prefix="mod"):
+    name = "%s%05d" % (prefix, index)
+    return name, compile(module_source(index, size), name + ".py", "exec")
+
+
+def encrypt(data, key):
+    """
+    Encrypt data the way PyInstaller encrypts PYZ entries with --key: AES
+    in CFB mode, the random IV stored in front.
+    """
+    key = key[:CRYPT_BLOCK_SIZE].zfill(CRYPT_BLOCK_SIZE)
+    iv = os.urandom(CRYPT_BLOCK_SIZE)
+    return iv + Crypto.Cipher.AES.new(key, Crypto.Cipher.AES.MODE_CFB, iv).encrypt(data)
+
+
+def pyz_data(entries=1000, size=4096, level=6, key=""):
+    """
+    A PYZ with entries modules of about size bytes of source each,
+    encrypted with key if one is given.
+    """
+    chunks = [b"PYZ\0", imp.get_magic(), b"\0" * 4]
+    pos = sum(len(x) for x in chunks)
+    toc = []
+    for i in range(entries):
+        name, co = module_code(i, size)
+        data = zlib.compress(marshal.dumps(co), level)
+        if key:
+            data = encrypt(data, key)
+        toc.append((name, (0, pos, len(data))))
+        chunks.append(data)
+        pos += len(data)
+    # the header holds the position of the marshalled TOC at the end
+    chunks[2] = struct.pack("!i", pos)
+    chunks.append(marshal.dumps(toc))
+    return b"".join(chunks)
+
+
+def build_pyz(path, entries=1000, size=4096, level=6, key=""):
+    """
+    Write a PYZ with entries modules of about size bytes of source each.
+
+    Returns the archive size in bytes.
+    """
+    data = pyz_data(entries, size, level, key)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def carchive_data(items, pyvers=None, pylib_name=b"python.dll"):
+    """
+    A CArchive of items, a list of (typcd, name, data, compress) tuples,
+    cookie included.
+    """
+    body = []
+    toc = []
+    pos = 0
+    for typcd, name, data, compress in items:
+        raw = zlib.compress(data, 9) if compress else data
+        # name is NUL terminated and the entry padded to 16 bytes
+        nm = name.encode("utf-8") + b"\0"
+        nm += b"\0" * (-(TOC_ENTRY.size + len(nm)) % 16)
+        toc.append(TOC_ENTRY.pack(TOC_ENTRY.size + len(nm), pos, len(raw), len(data),
+                                  1 if compress else 0, ord(typcd)) + nm)
+        body.append(raw)
+        pos += len(raw)
+    toc = b"".join(toc)
+    totallen = pos + len(toc) + COOKIE.size
+    cookie = COOKIE.pack(b"MEI\014\013\012\013\016", totallen, pos, len(toc),
+                         int(pyvers or PYVER), pylib_name)
+    return b"".join(body) + toc + cookie
+
+
+def build_carchive(path, items, prefix=b"", overlay=0, pyvers=None):
+    """
+    Write prefix (a stand-in for the bootloader), a CArchive of items and
+    overlay bytes of trailing data such as a code signature. The overlay
+    is a sparse hole, so even GBs of it are cheap to create.
+
+    Returns the file size in bytes.
+    """
+    with open(path, "wb") as f:
+        f.write(prefix)
+        f.write(carchive_data(items, pyvers))
+        if overlay:
+            f.seek(overlay - 1, 1)
+            f.write(b"\0")
+        return f.tell()
+
+
+def app_items(modules=1000, size=4096, level=6, key="", data_entries=0, data_size=65536, compress=True, nested=0):
+    """
+    The items of the CArchive of a frozen application: a script, the PYZ
+    with modules modules, data_entries files of data_size random bytes and
+    nested levels of embedded CArchives ('a' entries) holding the same
+    again. With a key the PYZ is encrypted and the key module PyInstaller
+    generates is bundled, as pyimod00_crypto_key.
+    """
+    items = [('s', 'main', marshal.dumps(module_code(0, size, "main")[1]), compress)]
+    if key:
+        key_module = compile("key = %r\n" % key, "pyimod00_crypto_key.py", "exec")
+        items.append(('m', 'pyimod00_crypto_key', marshal.dumps(key_module), compress))
+    items.append(('z', 'PYZ-00.pyz', pyz_data(modules, size, level, key), False))
+    for i in range(data_entries):
+        items.append(('x', 'data/file%05d.bin' % i, os.urandom(data_size), compress))
+    if nested:
+        inner = app_items(modules, size, level, key, data_entries, data_size, compress, nested - 1)
+        items.append(('a', 'nested%d.pkg' % nested, carchive_data(inner), False))
+    return items
+
+
+def build_app(path, modules=1000, size=4096, level=6, key="", data_entries=0, data_size=65536, compress=True,
+              nested=0, overlay=0):
+    """
+    Write a synthetic frozen application, see app_items(), behind a 4 KB
+    stand-in for the bootloader.
+
+    Returns the file size in bytes.
+    """
+    items = app_items(modules, size, level, key, data_entries, data_size, compress, nested)
+    return build_carchive(path, items, prefix=b"MZ" + b"\0" * 4094, overlay=overlay)
@@ -0,0 +1,17 @@
+# encoding: utf-8
+
+import os
+
+# modules of the cx_Freeze bootstrap, in the library zip
+MARKERS = ("__startup__", "BUILD_CONSTANTS", "cx_Freeze__init__")
+
+
+def sniff(probe):
+    """
+    cx_Freeze keeps the modules in a library zip: appended to the
+    executable up to cx_Freeze 4, in lib/library.zip next to it since.
+    """
+    if any(name.split('.')[0] in MARKERS for name in probe.zip_names()):
+        return True
+    return probe.kind in ("pe", "elf", "macho") and \
+        os.path.isfile(os.path.join(os.path.dirname(probe.path), "lib", "library.zip"))
@@ -0,0 +1,36 @@
+# encoding: utf-8
+
+import os
+
+from ..zipbundle import ZipBundleReader
+
+
+class CxFreezeReader(ZipBundleReader):
+    """
+    The library zip of a cx_Freeze application.
+    """
+
+    @staticmethod
+    def library(path):
+        """
+        lib/library.zip next to the executable path, where cx_Freeze 5
+        and later keep the modules.
+        """
+        return os.path.join(os.path.dirname(os.path.abspath(path)), "lib", "library.zip")
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """
+        Open the library zip of the cx_Freeze binary path: path itself if
+        it is a zip or has one appended (cx_Freeze 4), else the library
+        zip next to it.
+        """
+        try:
+            reader = cls(path, **kwargs)
+            if reader.toc:
+                return reader
+            reader.close()
+        except RuntimeError:
+            if not os.path.isfile(cls.library(path)):
+                raise
+        return cls(cls.library(path), **kwargs)
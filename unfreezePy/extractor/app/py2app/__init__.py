@@ -0,0 +1,18 @@
+# encoding: utf-8
+
+import os
+
+
+def sniff(probe):
+    """
+    A py2app application is an .app bundle whose Contents/Resources hold
+    the __boot__.py script: its Contents/MacOS executable, or the library
+    zip in Contents/Resources/lib.
+    """
+    if probe.kind == "macho":
+        resources = os.path.join(os.path.dirname(os.path.dirname(probe.path)), "Resources")
+    elif probe.kind == "zip":
+        resources = os.path.dirname(os.path.dirname(probe.path))
+    else:
+        return False
+    return os.path.isfile(os.path.join(resources, "__boot__.py"))
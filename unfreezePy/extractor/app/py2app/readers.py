@@ -0,0 +1,36 @@
+# encoding: utf-8
+
+import glob
+import os
+
+from ..zipbundle import ZipBundleReader
+
+
+class Py2appReader(ZipBundleReader):
+    """
+    The library zip of a py2app application bundle.
+    """
+
+    @staticmethod
+    def library(path):
+        """
+        Contents/Resources/lib/pythonXY.zip of the bundle whose executable
+        is path, None if there is none.
+        """
+        contents = os.path.dirname(os.path.dirname(os.path.abspath(path)))
+        libraries = sorted(glob.glob(os.path.join(contents, "Resources", "lib", "python*.zip")))
+        return libraries[0] if libraries else None
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """
+        Open the library zip of the py2app binary path: path itself if it
+        is a zip, else the one of its bundle.
+        """
+        try:
+            return cls(path, **kwargs)
+        except RuntimeError:
+            library = cls.library(path)
+            if library is None:
+                raise
+        return cls(library, **kwargs)
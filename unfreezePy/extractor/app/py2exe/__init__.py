@@ -0,0 +1,14 @@
+# encoding: utf-8
+
+# the script resource of the run stub and an environment variable it reads
+MARKERS = (b"PYTHONSCRIPT", u"PYTHONSCRIPT".encode("utf-16-le"), b"PY2EXE_VERBOSE")
+
+
+def sniff(probe):
+    """
+    A py2exe binary is a Windows executable built from its run stub, a
+    library zip of its own holds zipextimporter.
+    """
+    if probe.kind == "pe":
+        return any(probe.find(marker) for marker in MARKERS)
+    return probe.kind == "zip" and any(name.startswith("zipextimporter.") for name in probe.zip_names())
@@ -0,0 +1,28 @@
+# encoding: utf-8
+
+# see CArchiveReader.MAGIC and ZlibArchiveReader.MAGIC
+COOKIE_MAGIC = b'MEI\014\013\012\013\016'
+PYZ_MAGIC = b'PYZ\0'
+
+
+def sniff(probe):
+    """
+    A PyInstaller binary ends with the cookie of its CArchive, followed by
+    a code signature at most; a bare PYZ starts with its magic.
+    """
+    return COOKIE_MAGIC in probe.tail or probe.head.startswith(PYZ_MAGIC)
+
+
+def scan(probe):
+    """
+    Look for the cookie in the whole file, for one that lies further
+    back than the tail: behind a large code signature or overlay. The
+    file is scanned backwards in bounded chunks, still this reads all of
+    a file that is no PyInstaller binary, so it is only tried once no
+    format recognised the probe.
+    """
+    from .readers import CArchiveReader
+    with open(probe.path, 'rb') as fp:
+        for _cookie in CArchiveReader.iter_cookies(fp):
+            return True
+    return False
@@ -1,7 +1,11 @@
 # encoding: utf-8
 
 import StringIO
+import array
+import hashlib
 import marshal
+import mmap
+import multiprocessing
 import struct
 import sys
 import zlib
@@ -9,6 +13,7 @@ import zlib
 import Crypto.Cipher.AES
 
 from . import utils
+from ...events import EventStream, clock
 
 
 def marshal_load(data,pyver):
@@ -16,10 +21,177 @@ def marshal_load(data,pyver):
     fpath = pyc.co_filename #.pyc
     if fpath.endswith(".py"):
         fpath += "c"
-    _data = utils.get_magic_string(pyver) + data
+    _data = utils.get_magic_string(pyver) + bytes(data)
     return fpath,_data
 
 
+# module PyInstaller generates to hold the key of encrypted PYZ archives
+CRYPTO_KEY_MODULE = 'pyimod00_crypto_key'
+
+
+# marshal type codes of the strings a code object can hold, with the size of
+# their length field: str/bytes, interned, unicode, and the ascii forms of 3.4+
+_MARSHAL_STRINGS = {'s': 4, 't': 4, 'u': 4, 'a': 4, 'A': 4, 'z': 1, 'Z': 1}
+# int fields before co_code: 2.7 (4), 3.0-3.7 and 3.11+ (5), 3.8-3.10 (6)
+_CODE_HEADER_FIELDS = (4, 5, 6)
+
+
+def _marshal_code(data, pos):
+    # the type code at pos, without the FLAG_REF bit of 3.4+
+    return chr(ord(data[pos:pos + 1]) & 0x7f) if pos < len(data) else None
+
+
+def _marshal_string(data, pos):
+    """
+    The string marshalled at pos in data and the position after it, None
+    if there is no string there.
+    """
+    size = _MARSHAL_STRINGS.get(_marshal_code(data, pos))
+    if size is None or pos + 1 + size > len(data):
+        return None
+    n, = struct.unpack('<i' if size == 4 else '<B', data[pos + 1:pos + 1 + size])
+    start = pos + 1 + size
+    if n < 0 or start + n > len(data):
+        return None
+    return data[start:start + n], start + n
+
+
+def crypto_key(data):
+    """
+    The key held by the pyimod00_crypto_key module PyInstaller bundles
+    with --key, data being its marshalled code (a .pyc header is skipped
+    if there is one). None if it cannot be read.
+
+    The marshal bytes are walked by hand rather than with marshal.loads(),
+    which cannot read the code of another Python version: the key is the
+    first constant of "key = '...'", right after co_code.
+    """
+    data = bytes(data)
+    for offset in (0, 8, 12, 16):
+        if data[offset:offset + 1] not in (b'c', b'\xe3'):
+            continue
+        for fields in _CODE_HEADER_FIELDS:
+            pos = offset + 1 + 4 * fields
+            # co_code is always a str/bytes object
+            co_code = _marshal_string(data, pos) if _marshal_code(data, pos) == 's' else None
+            if co_code is None:
+                continue
+            pos = co_code[1]
+            # co_consts, a tuple or a small tuple (3.4+)
+            code = _marshal_code(data, pos)
+            if code == '(':
+                pos += 5
+            elif code == ')':
+                pos += 2
+            else:
+                continue
+            key = _marshal_string(data, pos)
+            if key is not None and key[0]:
+                return key[0]
+    return None
+
+
+class StreamedEntry(object):
+    """
+    The data of an entry too big to be read and decompressed at once.
+    iter_chunks() reads it chunk_size bytes at a time and inflates each
+    piece into at most chunk_size bytes, so the memory it takes does not
+    depend on its size. Stored pieces read from a mapping are views into
+    it. len() is its uncompressed size.
+
+    wbits is that of zlib.decompressobj(), None for stored data.
+    """
+
+    def __init__(self, reader, name, pos, length, ulen, wbits=zlib.MAX_WBITS):
+        self.reader = reader
+        self.name = name
+        self.pos = pos
+        self.length = length
+        self.ulen = ulen
+        self.wbits = wbits
+
+    def __len__(self):
+        return self.ulen
+
+    def iter_chunks(self, chunk_size=None, inflate=True):
+        """
+        Yield the data in pieces of at most chunk_size bytes, CHUNK_SIZE
+        of the reader by default; inflate=False yields it as stored.
+        """
+        chunk_size = chunk_size or self.reader.CHUNK_SIZE
+        inflater = zlib.decompressobj(self.wbits) if inflate and self.wbits is not None else None
+        seconds = 0.0
+        size = 0
+        for offset in range(0, self.length, chunk_size):
+            data = self.reader.read_at(self.pos + offset, min(chunk_size, self.length - offset))
+            if inflater is None:
+                size += len(data)
+                yield data
+                continue
+            data = bytes(data)
+            while data:
+                started = clock()
+                chunk = inflater.decompress(data, chunk_size)
+                seconds += clock() - started
+                # whatever did not fit is handed in again
+                data = inflater.unconsumed_tail
+                if chunk:
+                    size += len(chunk)
+                    yield chunk
+        if inflater is not None:
+            chunk = inflater.flush()
+            if chunk:
+                size += len(chunk)
+                yield chunk
+            self.reader.events.add("decompress", seconds, size, self.name)
+
+    def digest(self, inflate=True):
+        """
+        sha1 of the uncompressed data, of the data as stored if not
+        inflate.
+        """
+        sha1 = hashlib.sha1()
+        for chunk in self.iter_chunks(inflate=inflate):
+            sha1.update(chunk)
+        return sha1.hexdigest()
+
+
+class CompactToc(object):
+    """
+    A CArchive TOC held in arrays instead of a tuple per entry, for
+    archives with very many entries. Reads like the list of
+    (dpos, dlen, ulen, flag, typcd, name) toc_read_from_binary() returns,
+    the tuples are built as they are asked for.
+    """
+
+    def __init__(self):
+        self.dpos = array.array('i')
+        self.dlen = array.array('i')
+        self.ulen = array.array('i')
+        self.flags = bytearray()
+        self.typcds = bytearray()
+        self.names = []
+
+    def append(self, entry):
+        dpos, dlen, ulen, flag, typcd, name = entry
+        self.dpos.append(dpos)
+        self.dlen.append(dlen)
+        self.ulen.append(ulen)
+        self.flags.append(flag)
+        self.typcds.append(ord(typcd))
+        self.names.append(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        return self.dpos[i], self.dlen[i], self.ulen[i], self.flags[i], chr(self.typcds[i]), self.names[i]
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield self[i]
+
+
 class ArchiveReader(object):
     """
     A base class for a repository of python code objects.
@@ -32,16 +204,34 @@ class ArchiveReader(object):
     MAGIC = b'PYL\0'
     HDRLEN = 12  # default is MAGIC followed by python's magic, int pos of toc
     TOCPOS = 8
+    _toc_entry = struct.Struct('!iiiiBB')  # (structlen, dpos, dlen, ulen, flag, typcd) followed by name
+    # data entries larger than this are streamed, see StreamedEntry
+    STREAM_THRESHOLD = 32 << 20
+    CHUNK_SIZE = 1 << 20
+    # entries per task of the decompression threads, see utils.ordered_map()
+    INFLATE_BATCH = 1
     os = None
     _bincache = None
 
-    def __init__(self, path=None, start=0, fp=None):
+    def __init__(self, path=None, start=0, fp=None, mapping=None, use_mmap=False, threads=1, events=None):
         """
         Initialize an Archive. If path is omitted, it will be an empty Archive.
+
+        mapping      an mmap (or byte string) holding the archive; entries are
+                     returned as zero-copy views into it.
+        use_mmap     map the file at path instead of doing a seek()/read()
+                     per entry.
+        threads      number of threads decompressing entries, output order
+                     does not depend on it.
+        events       EventStream the stage timers and entries are reported
+                     to, a quiet one if None.
         """
         self.toc = None
         self.path = path
         self.start = start
+        self.mapping = mapping
+        self.threads = threads
+        self.events = events if events is not None else EventStream()
 
         # In Python 3 module 'imp' is no longer built-in and we cannot use it.
         # There is for Python 3 another way how to obtain magic value.
@@ -61,20 +251,61 @@ class ArchiveReader(object):
             else:
                 # Python 3.5+
                 self.pymagic = _frozen_importlib._bootstrap_external.MAGIC_NUMBER
+        # the file or mapping this reader opened itself, see close()
+        self._opened = None
         if fp:
             self.file = fp
+        elif mapping is not None:
+            # mmap objects are file-like themselves, plain strings are not
+            self.file = mapping if isinstance(mapping, mmap.mmap) else StringIO.StringIO(mapping)
         else:
-            self.file = open(self.path, 'rb')
-        self.checkmagic()
-        self.loadtoc()
+            self.file = self._opened = open(self.path, 'rb')
+            if use_mmap:
+                self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                # the mapping holds its own handle of the file
+                self.file.close()
+                self.file = self._opened = self.mapping
+        try:
+            self.checkmagic()
+            started = clock()
+            self.loadtoc()
+        except Exception:
+            self.close()
+            raise
+        self.events.add("toc", clock() - started, name=self.path, entries=len(self.toc))
+
+    def close(self):
+        """
+        Close the file or the mapping the reader opened; those it was
+        handed (fp, mapping) are left to their owner. Views into the
+        mapping the reader returned must not be used afterwards.
+        """
+        if self._opened is None:
+            return
+        if self._opened is self.mapping:
+            self.mapping = None
+        self._opened.close()
+        self._opened = None
+
+    def read_at(self, pos, length):
+        """
+        Return length bytes at the absolute position pos. With a mapping
+        this is a view into it and nothing is copied.
+        """
+        if self.mapping is not None:
+            return utils.buffer_view(self.mapping, pos, length)
+        self.file.seek(pos)
+        return self.file.read(length)
 
 
-    @staticmethod
-    def toc_read_from_binary(s):
+    @classmethod
+    def toc_read_from_binary(cls, s, compact=False):
         """
         Decode the binary string into an in memory list.
 
-        S is a binary string.
+        S is a binary string, or a buffer/memoryview of one: entries are
+        unpacked in place, only the names are copied out. compact returns
+        a CompactToc instead of a list.
         """
 
         # pyinstaller/bootloader/pyi_archive.h
@@ -90,21 +321,20 @@ class ArchiveReader(object):
         #     char name[1];    /* the name to save it as */
         #     /* starting in v5, we stretch this out to a mult of 16 */
         # } TOC;
-        ENTRYSTRUCT = '!iiiiBB'  # (structlen, dpos, dlen, ulen, flag, typcd) followed by name
-        ENTRYLEN = struct.calcsize(ENTRYSTRUCT)
+        unpack_from = cls._toc_entry.unpack_from
+        ENTRYLEN = cls._toc_entry.size
         p = 0
-        toc = []
-        while p < len(s):
-            (slen, dpos, dlen, ulen, flag, typcd) = struct.unpack(ENTRYSTRUCT, s[p:p + ENTRYLEN])
-            nmlen = slen - ENTRYLEN
-            p = p + ENTRYLEN
-            (nm,) = struct.unpack('%is' % nmlen, s[p:p + nmlen])
-            p = p + nmlen
+        end = len(s)
+        toc = CompactToc() if compact else []
+        append = toc.append
+        while p < end:
+            (slen, dpos, dlen, ulen, flag, typcd) = unpack_from(s, p)
+            if slen < ENTRYLEN or p + slen > end:
+                raise RuntimeError("Bad TOC entry at offset %d" % p)
             # nm may have up to 15 bytes of padding
-            nm = nm.rstrip(b'\0')
-            nm = nm.decode('utf-8')
-            typcd = chr(typcd)
-            toc.append((dpos, dlen, ulen, flag, typcd, nm))
+            nm = bytes(s[p + ENTRYLEN:p + slen]).rstrip(b'\0')
+            append((dpos, dlen, ulen, flag, chr(typcd), nm.decode('utf-8')))
+            p += slen
         return toc
 
     def loadtoc(self):
@@ -113,12 +343,57 @@ class ArchiveReader(object):
         """
         raise NotImplementedError
 
-    def extract(self):
+    def iter_toc(self):
+        """
+        Yield (archive, typcd, name, length, ulen) for every entry without
+        reading or decompressing any entry data. archive is the name of the
+        embedded archive holding the entry, None at the top level; ulen is
+        None where the TOC does not record it.
+        """
+        raise NotImplementedError
+
+    def iter_extract(self, select=None):
+        """
+        Yield the contents of the archive one entry at a time as
+        (typcd, path, data) tuples, so that only a single decompressed
+        entry has to be held in memory. Data entries above
+        STREAM_THRESHOLD come as a StreamedEntry to be read in chunks
+        before the next entry is asked for.
+
+        select(typcd, name) -> bool limits this to the matching entries,
+        the others are not even read. Embedded archives are passed in as
+        well and only descended into if selected.
+        """
+        raise NotImplementedError
+
+    def iter_digests(self, select=None, content=False):
         """
-        Get the contents of an entry.
+        Yield (archive, typcd, name, digest) for every entry like
+        iter_toc(), digest being the sha1 of the entry data as stored
+        (compressed, maybe encrypted). Only embedded archives are
+        decompressed, not the entries.
+
+        content hashes the decrypted and decompressed data instead, for
+        entries whose stored bytes differ but their content may not.
         """
         raise NotImplementedError
 
+    def get(self, name):
+        """
+        Return the (typcd, path, data) tuple iter_extract() would yield
+        for the entry name, KeyError if there is none.
+        """
+        select = lambda typcd, nm: nm == name or typcd.lower() == 'z'
+        for entry in self.iter_extract(select):
+            return entry
+        raise KeyError(name)
+
+    def extract(self):
+        """
+        Get the contents of all entries as a list.
+        """
+        return list(self.iter_extract())
+
     def checkmagic(self):
         """
         Overridable.
@@ -166,8 +441,11 @@ class CArchiveReader(ArchiveReader):
     #
     _cookie_format = '!8siiii64s'
     _cookie_size = struct.calcsize(_cookie_format)
+    # the cookie is searched backwards from EOF in blocks of this size
+    SCAN_CHUNK = 1 << 20
 
-    def __init__(self, archive_path, start=0, length=0, fp=None, pylib_name='', key=""):
+    def __init__(self, archive_path, start=0, length=0, fp=None, pylib_name='', key="", use_mmap=False, threads=1,
+                 processes=1, compact_toc=False, events=None):
         """
         Constructor.
 
@@ -175,14 +453,83 @@ class CArchiveReader(ArchiveReader):
         start        is the seekposition within PATH.
         len          is the length of the CArchive (if 0, then read till EOF).
         pylib_name   name of Python DLL which bootloader will use.
+        use_mmap     map the file and open embedded PYZ archives as views
+                     into the mapping.
+        threads      number of threads decompressing entries, embedded PYZ
+                     archives inherit it.
+        key          key of the embedded PYZ archives, looked up in the
+                     bundled pyimod00_crypto_key module if not given.
+        processes    number of processes decrypting the entries of an
+                     encrypted PYZ, see ZlibArchiveReader.
+        compact_toc  hold the TOC in a CompactToc, for archives with very
+                     many entries.
         """
         self.length = length
+        self.compact_toc = compact_toc
         self.pylib_name = pylib_name
         self.key = key
+        self.processes = processes
 
         # A CArchive created from scratch starts at 0, no leading bootloader.
         self.pkg_start = 0
-        super(CArchiveReader, self).__init__(archive_path, start, fp)
+        super(CArchiveReader, self).__init__(archive_path, start, fp, use_mmap=use_mmap, threads=threads,
+                                             events=events)
+        if not self.key and self.toc:
+            self.key = self.find_key() or ""
+
+    @classmethod
+    def iter_cookies(cls, fp, end=None, chunk_size=None):
+        """
+        Scan the file object fp backwards from end (default: EOF) and yield
+        (cookie_pos, totallen, tocpos, toclen, pyvers, pylib_name) for every
+        valid cookie, the last one first.
+
+        The file is read in chunk_size blocks, so memory stays bounded
+        however much data (code signatures, overlays, other archives)
+        follows the archive. A candidate only counts if the package and TOC
+        it describes fit in the file before it.
+        """
+        chunk_size = chunk_size or cls.SCAN_CHUNK
+        if end is None:
+            fp.seek(0, 2)
+            end = fp.tell()
+        # blocks overlap so that a magic across a block boundary is found
+        overlap = len(cls.MAGIC) - 1
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            fp.seek(start)
+            buf = fp.read(min(pos + overlap, end) - start)
+            hit = buf.rfind(cls.MAGIC)
+            while hit != -1:
+                cookie_pos = start + hit
+                if cookie_pos < pos and cookie_pos + cls._cookie_size <= end:
+                    if hit + cls._cookie_size <= len(buf):
+                        cookie = buf[hit:hit + cls._cookie_size]
+                    else:
+                        fp.seek(cookie_pos)
+                        cookie = fp.read(cls._cookie_size)
+                    (magic, totallen, tocpos, toclen, pyvers, pylib_name) = struct.unpack(cls._cookie_format, cookie)
+                    pkg_start = cookie_pos + cls._cookie_size - totallen
+                    if pkg_start >= 0 and tocpos >= 0 and toclen > 0 \
+                            and pkg_start + tocpos + toclen <= cookie_pos and 10 <= pyvers < 1000:
+                        yield cookie_pos, totallen, tocpos, toclen, pyvers, pylib_name
+                hit = buf.rfind(cls.MAGIC, 0, hit)
+            pos = start
+
+    @classmethod
+    def find_archives(cls, path, chunk_size=None):
+        """
+        Return (pkg_start, length, pyvers, pylib_name) of every CArchive
+        in the file at path, the last one first. Each can be opened with
+        CArchiveReader(path, start=pkg_start, length=length).
+        """
+        archives = []
+        with open(path, 'rb') as fp:
+            for cookie_pos, totallen, tocpos, toclen, pyvers, pylib_name in cls.iter_cookies(fp, None, chunk_size):
+                archives.append((cookie_pos + cls._cookie_size - totallen, totallen, pyvers,
+                                 pylib_name.rstrip(b'\0')))
+        return archives
 
     def checkmagic(self):
         """
@@ -191,24 +538,18 @@ class CArchiveReader(ArchiveReader):
         """
         # Magic is at EOF; if we're embedded, we need to figure where that is.
         if self.length:
-            self.file.seek(self.start + self.length, 0)
+            end = self.start + self.length
         else:
             self.file.seek(0, 2)
-        filelen = self.file.tell()
+            end = self.file.tell()
 
-        self.file.seek(max(0, filelen - 4096))
-        searchpos = self.file.tell()
-        buf = self.file.read(min(filelen, 4096))
-        pos = buf.rfind(self.MAGIC)
-        if pos == -1:
-            raise RuntimeError("%s is not a valid %s archive file" %
-                               (self.path, self.__class__.__name__))
-        filelen = searchpos + pos + self._cookie_size
-        (magic, totallen, self.tocpos, self.toclen, self.pyvers, pylib_name) = struct.unpack(
-            self._cookie_format, buf[pos:pos + self._cookie_size])
-        if magic != self.MAGIC:
+        for cookie in self.iter_cookies(self.file, end):
+            break
+        else:
             raise RuntimeError("%s is not a valid %s archive file" %
                                (self.path, self.__class__.__name__))
+        (cookie_pos, totallen, self.tocpos, self.toclen, self.pyvers, pylib_name) = cookie
+        filelen = cookie_pos + self._cookie_size
 
         self.pkg_start = filelen - totallen
         if self.length:
@@ -222,18 +563,111 @@ class CArchiveReader(ArchiveReader):
             raise RuntimeError('Python library filename not defined in archive.')
 
     def loadtoc(self):
-        self.file.seek(self.pkg_start + self.tocpos)
-        tocstr = self.file.read(self.toclen)
-        self.toc = self.toc_read_from_binary(tocstr)
+        tocstr = self.read_at(self.pkg_start + self.tocpos, self.toclen)
+        self.toc = self.toc_read_from_binary(tocstr, self.compact_toc)
 
-    def extract(self):
-        result = []
-        for dpos, dlen, ulen, flag, typcd, name in self.toc:
-            print (dpos, dlen, ulen, flag, typcd, name)
-            self.file.seek(self.pkg_start + dpos)
-            rslt = self.file.read(dlen)
-            if flag == 1:   # compressed
-                rslt = zlib.decompress(rslt)
+    def _streamed(self, entry):
+        """
+        A StreamedEntry for the TOC entry if it is a data entry too big to
+        be read at once, else None. Code and embedded PYZ are never big.
+        """
+        dpos, dlen, ulen, flag, typcd, name = entry
+        if typcd in 'mMszZ' or max(dlen, ulen) <= self.STREAM_THRESHOLD:
+            return None
+        return StreamedEntry(self, name, self.pkg_start + dpos, dlen, ulen, zlib.MAX_WBITS if flag == 1 else None)
+
+    def _read_entry(self, entry):
+        # (entry, stored data), a big entry is left for the consumer to read
+        streamed = self._streamed(entry)
+        if streamed is not None:
+            return entry, streamed
+        return entry, self.read_at(self.pkg_start + entry[0], entry[1])
+
+    def _inflate(self, item):
+        entry, rslt = item
+        if isinstance(rslt, StreamedEntry):
+            return item
+        if entry[3] == 1:   # compressed
+            started = clock()
+            rslt = zlib.decompress(rslt)
+            self.events.add("decompress", clock() - started, len(rslt), entry[5])
+        return entry, rslt
+
+    def find_key(self):
+        """
+        The PYZ key from the bundled pyimod00_crypto_key module, None if
+        the archive has no such module. Raises a RuntimeError if the
+        module is there but the key cannot be read from it.
+        """
+        for entry in self.toc:
+            dpos, dlen, ulen, flag, typcd, name = entry
+            if typcd == 'm' and name == CRYPTO_KEY_MODULE:
+                key = crypto_key(self._inflate((entry, self.read_at(self.pkg_start + dpos, dlen)))[1])
+                if self.events.active:
+                    self.events.emit("key", archive=self.path, found=key is not None)
+                if key is None:
+                    raise RuntimeError("%s has an encrypted PYZ but its key could not be read from %s"
+                                       % (self.path, CRYPTO_KEY_MODULE))
+                return key
+        return None
+
+    def _open_pyz(self, entry, rslt):
+        """
+        Open the embedded PYZ of the TOC entry, rslt is its (decompressed)
+        content.
+        """
+        dpos, dlen, ulen, flag, typcd, name = entry
+        if self.mapping is not None:
+            if flag == 1:
+                return ZlibArchiveReader(name, offset=0, mapping=rslt, pyver=self.pyvers, key=self.key,
+                                         threads=self.threads, processes=self.processes, events=self.events)
+            # stored: open it in place as a view of our own mapping
+            return ZlibArchiveReader(name, offset=self.pkg_start + dpos, mapping=self.mapping, pyver=self.pyvers,
+                                     key=self.key, threads=self.threads, processes=self.processes,
+                                     length=dlen, events=self.events)
+        _io = StringIO.StringIO(rslt)
+        _io.seek(0)
+        return ZlibArchiveReader(name,fp=_io,pyver=self.pyvers,key=self.key,threads=self.threads,
+                                 processes=self.processes,events=self.events)
+
+    def iter_toc(self):
+        for entry in self.toc:
+            dpos, dlen, ulen, flag, typcd, name = entry
+            yield None, typcd, name, dlen, ulen
+            if typcd.lower() == 'z':
+                # only the PYZ itself is read, not its members
+                rslt = self._inflate((entry, self.read_at(self.pkg_start + dpos, dlen)))[1]
+                for _archive, _typcd, _name, _length, _ulen in self._open_pyz(entry, rslt).iter_toc():
+                    yield name, _typcd, _name, _length, _ulen
+
+    def iter_digests(self, select=None, content=False):
+        for entry in self.toc:
+            dpos, dlen, ulen, flag, typcd, name = entry
+            if select is not None and not select(typcd, name):
+                continue
+            streamed = self._streamed(entry)
+            if streamed is not None:
+                yield None, typcd, name, streamed.digest(inflate=content)
+                continue
+            raw = self.read_at(self.pkg_start + dpos, dlen)
+            if typcd.lower() == 'z':
+                rslt = self._inflate((entry, raw))[1]
+                for _archive, _typcd, _name, digest in self._open_pyz(entry, rslt).iter_digests(select, content):
+                    yield name, _typcd, _name, digest
+            else:
+                if content:
+                    raw = self._inflate((entry, raw))[1]
+                yield None, typcd, name, hashlib.sha1(raw).hexdigest()
+
+    def iter_extract(self, select=None):
+        toc = self.toc if select is None else [entry for entry in self.toc if select(entry[4], entry[5])]
+        # raw reads stay in this thread, only the decompression is spread
+        raw = (self._read_entry(entry) for entry in toc)
+        for entry, rslt in utils.ordered_map(self._inflate, raw, self.threads, batch=self.INFLATE_BATCH):
+            dpos, dlen, ulen, flag, typcd, name = entry
+            if self.events.active:
+                self.events.emit("entry", archive=self.path, pos=dpos, length=dlen, ulen=ulen, flag=flag,
+                                 typcd=typcd, name=name)
             #
             # xformdict = {'PYMODULE': 'm',
             #              'PYSOURCE': 's',
@@ -258,18 +692,20 @@ class CArchiveReader(ArchiveReader):
             # define ARCHIVE_ITEM_DATA             'x'  /* data */
             # define ARCHIVE_ITEM_RUNTIME_OPTION   'o'  /* runtime option */
             if typcd == 'm':
-                result.append((typcd, name, rslt))
+                yield typcd, name, rslt
             elif typcd == 's':
+                started = clock()
                 _fpath, _data = marshal_load(rslt, self.pyvers)
-                result.append((typcd, _fpath, _data))
+                self.events.add("unmarshal", clock() - started, len(rslt), name)
+                yield typcd, _fpath, _data
             elif typcd.lower() == 'z':
-                _io = StringIO.StringIO(rslt)
-                _io.seek(0)
-                zlib_arch = ZlibArchiveReader(name,fp=_io,pyver=self.pyvers,key=self.key)
-                result += zlib_arch.extract()
+                zlib_arch = self._open_pyz(entry, rslt)
+                # drop our reference, the nested reader owns the buffer now
+                rslt = None
+                for entry in zlib_arch.iter_extract(select):
+                    yield entry
             else:
-                result.append((typcd, name, rslt))
-        return result
+                yield typcd, name, rslt
 
 
 class Cipher(object):
@@ -302,9 +738,31 @@ class Cipher(object):
         return self._aes.new(self.key, self._aes.MODE_CFB, iv)
 
     def decrypt(self, data):
+        data = bytes(data)
         return self.__create_cipher(data[:self.CRYPT_BLOCK_SIZE]).decrypt(data[self.CRYPT_BLOCK_SIZE:])
 
 
+# Cipher of a decrypt worker process, see ZlibArchiveReader._decoded()
+_worker_cipher = None
+
+
+def _init_decode_worker(key):
+    global _worker_cipher
+    _worker_cipher = Cipher(key)
+
+
+def _decode_entries(batch):
+    # decrypt and decompress a batch of PYZ entries in a worker process
+    decoded = []
+    for name, typ, pos, length, obj in batch:
+        started = clock()
+        obj = _worker_cipher.decrypt(obj)
+        decrypted = clock()
+        obj = zlib.decompress(obj)
+        decoded.append((name, typ, pos, length, obj, decrypted - started, clock() - decrypted))
+    return decoded
+
+
 class ZlibArchiveReader(ArchiveReader):
     """
     ZlibArchive - an archive with compressed entries. Archive is read
@@ -323,8 +781,24 @@ class ZlibArchiveReader(ArchiveReader):
     PYZ_TYPE_MODULE = 0
     PYZ_TYPE_PKG = 1
     PYZ_TYPE_DATA = 2
-
-    def __init__(self, path, offset=None, fp=None, pyver=None, key=""):
+    # the matching CArchive type codes, used by iter_toc() and select
+    PYZ_TYPECODES = {PYZ_TYPE_MODULE: 'm', PYZ_TYPE_PKG: 'M', PYZ_TYPE_DATA: 'x'}
+    # entries per task of a decrypt worker process
+    DECODE_BATCH = 64
+    # modules are a few KB, a task for each would cost more than inflating it
+    INFLATE_BATCH = 64
+
+    def __init__(self, path, offset=None, fp=None, pyver=None, key="", mapping=None, use_mmap=False, threads=1,
+                 processes=1, length=None, events=None):
+        """
+        processes    number of worker processes decrypting and decompressing
+                     the entries of an encrypted PYZ in one go. AES does not
+                     release the GIL, threads would not help there. At most
+                     one per CPU: with a single one the entries are decrypted
+                     in this process, a pool would only add its overhead.
+        length       size of the PYZ, if it does not run to the end of the
+                     file or mapping; the TOC read stops there.
+        """
         if path is None:
             offset = 0
         elif offset is None:
@@ -341,7 +815,10 @@ class ZlibArchiveReader(ArchiveReader):
             else:
                 offset = 0
         self.pyver = pyver
-        super(ZlibArchiveReader, self).__init__(path, offset, fp)
+        self.processes = min(processes, multiprocessing.cpu_count())
+        self.length = length
+        super(ZlibArchiveReader, self).__init__(path, offset, fp, mapping=mapping, use_mmap=use_mmap,
+                                                threads=threads, events=events)
 
         self.cipher = Cipher(key)
 
@@ -354,25 +831,102 @@ class ZlibArchiveReader(ArchiveReader):
         """
         self.file.seek(self.start + self.TOCPOS)
         (offset,) = struct.unpack('!i', self.file.read(4))
-        self.file.seek(self.start + offset)
+        # the TOC runs to the end of the archive
+        if self.length:
+            tocdata = self.read_at(self.start + offset, self.length - offset)
+        elif self.mapping is not None:
+            tocdata = utils.buffer_view(self.mapping, self.start + offset)
+        else:
+            self.file.seek(self.start + offset)
+            tocdata = self.file.read()
         # Use marshal.loads() since load() arg must be a file object
         # Convert the read list into a dict for faster access
-        self.toc = dict(marshal.loads(self.file.read()))
+        self.toc = dict(marshal.loads(tocdata))
 
-    def extract(self):
-        data = []
+    def _iter_raw(self, select=None):
+        # raw reads stay in the calling thread, only decrypt/decompress is spread
         for name in self.toc:
             typ, pos, length = self.toc[name]
-            self.file.seek(self.start + pos)
-            obj = self.file.read(length)
-            try:
-                if self.cipher.has_key:
-                    obj = self.cipher.decrypt(obj)
-                obj = zlib.decompress(obj)
-                if typ in (self.PYZ_TYPE_MODULE, self.PYZ_TYPE_PKG):
-                    name,obj = marshal_load(obj,self.pyver)
-            except EOFError:
-                raise ImportError("PYZ entry '%s' failed to unmarshal" % name)
-            print("pyz",typ, pos, length,name)
-            data.append((typ, name, obj))
-        return data
+            if select is not None and not select(self.PYZ_TYPECODES.get(typ, 'x'), name):
+                continue
+            yield name, typ, pos, length, self.read_at(self.start + pos, length)
+
+    def _decode(self, name, obj):
+        # the stored bytes of entry name, decrypted and decompressed
+        events = self.events
+        if self.cipher.has_key:
+            started = clock()
+            obj = self.cipher.decrypt(obj)
+            events.add("decrypt", clock() - started, len(obj), name)
+        started = clock()
+        obj = zlib.decompress(obj)
+        events.add("decompress", clock() - started, len(obj), name)
+        return obj
+
+    def _decoded(self, items):
+        """
+        Decode the (name, typ, pos, length, obj) items of _iter_raw() in
+        input order: over the worker processes, a batch of entries per
+        task, if the PYZ is encrypted and there are several, else over the
+        threads.
+        """
+        if self.processes <= 1 or not self.cipher.has_key:
+            for item in utils.ordered_map(self._decode_item, items, self.threads, batch=self.INFLATE_BATCH):
+                yield item
+            return
+        events = self.events
+        pool = multiprocessing.Pool(self.processes, _init_decode_worker, (self.cipher.key,))
+        # workers get plain strings, views of a mapping do not pickle
+        batches = utils.batched(((name, typ, pos, length, bytes(obj)) for name, typ, pos, length, obj in items),
+                                self.DECODE_BATCH)
+        for batch in utils.ordered_map(_decode_entries, batches, self.processes, pool=pool):
+            for name, typ, pos, length, obj, decrypt_seconds, decompress_seconds in batch:
+                events.add("decrypt", decrypt_seconds, length, name)
+                events.add("decompress", decompress_seconds, len(obj), name)
+                yield name, typ, pos, length, obj
+
+    def _decode_item(self, item):
+        name, typ, pos, length, obj = item
+        return name, typ, pos, length, self._decode(name, obj)
+
+    def _unmarshal(self, item):
+        name, typ, pos, length, obj = item
+        try:
+            if typ in (self.PYZ_TYPE_MODULE, self.PYZ_TYPE_PKG):
+                started = clock()
+                name,obj = marshal_load(obj,self.pyver)
+                self.events.add("unmarshal", clock() - started, len(obj), name)
+        except EOFError:
+            raise ImportError("PYZ entry '%s' failed to unmarshal" % name)
+        return typ, pos, length, name, obj
+
+    def _inflate(self, item):
+        return self._unmarshal(self._decode_item(item))
+
+    def iter_toc(self):
+        for name in self.toc:
+            typ, pos, length = self.toc[name]
+            yield None, self.PYZ_TYPECODES.get(typ, 'x'), name, length, None
+
+    def iter_digests(self, select=None, content=False):
+        items = self._iter_raw(select)
+        if content:
+            items = self._decoded(items)
+        for name, typ, pos, length, obj in items:
+            yield None, self.PYZ_TYPECODES.get(typ, 'x'), name, hashlib.sha1(obj).hexdigest()
+
+    def iter_extract(self, select=None):
+        if self.processes > 1 and self.cipher.has_key:
+            items = (self._unmarshal(item) for item in self._decoded(self._iter_raw(select)))
+        else:
+            items = utils.ordered_map(self._inflate, self._iter_raw(select), self.threads, batch=self.INFLATE_BATCH)
+        for typ, pos, length, name, obj in items:
+            if self.events.active:
+                self.events.emit("entry", archive=self.path, pos=pos, length=length, typ=typ, name=name)
+            yield typ, name, obj
+
+    def get(self, name):
+        # the TOC is a dict, no need to scan it
+        typ, pos, length = self.toc[name]
+        typ, pos, length, name, obj = self._inflate((name, typ, pos, length, self.read_at(self.start + pos, length)))
+        return typ, name, obj
@@ -1,4 +1,7 @@
+import collections
+import functools
 import struct
+from multiprocessing.pool import ThreadPool
 
 padding = '\x00\x00\x00\x00'
 
@@ -34,3 +37,81 @@ PYTHON_MAGIC = {
 def get_magic_string(pyver):
     return PYTHON_MAGIC.get(str(pyver)) + padding
 
+
+
+try:
+    _buffer = buffer
+except NameError:
+    # Python 3
+    _buffer = None
+
+
+def buffer_view(obj, offset=0, length=None):
+    """
+    Zero-copy slice of obj (an mmap or a byte string).
+
+    Python 2 mmap objects do not support memoryview, so the old style
+    buffer() is used there.
+    """
+    if length is None:
+        length = len(obj) - offset
+    if _buffer is not None:
+        return _buffer(obj, offset, length)
+    return memoryview(obj)[offset:offset + length]
+
+
+def batched(iterable, size):
+    """
+    Group the items of iterable into lists of size items, the last one
+    may be shorter.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _map_batch(func, items):
+    return [func(item) for item in items]
+
+
+def ordered_map(func, iterable, threads=1, window=None, pool=None, batch=1):
+    """
+    Like itertools.imap(), but func runs on a pool of threads. Results
+    are yielded in input order and at most window tasks (default twice
+    the threads) are in flight, so memory stays bounded.
+
+    Meant for work that releases the GIL, such as zlib.decompress. For
+    work that does not, pool may be a multiprocessing.Pool of threads
+    processes to run func on instead; it is closed once done.
+
+    A task maps batch items: for small items, such as PYZ modules of a
+    few KB, handing each one to the pool costs more than func itself.
+    """
+    if threads <= 1 and pool is None:
+        for item in iterable:
+            yield func(item)
+        return
+    if batch > 1:
+        for results in ordered_map(functools.partial(_map_batch, func), batched(iterable, batch), threads,
+                                   window, pool):
+            for result in results:
+                yield result
+        return
+    window = window or threads * 2
+    pool = pool or ThreadPool(threads)
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
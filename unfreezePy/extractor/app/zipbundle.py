@@ -0,0 +1,206 @@
+# encoding: utf-8
+
+import hashlib
+import struct
+import zlib
+
+from .pyinstaller import utils
+from .pyinstaller.readers import ArchiveReader, StreamedEntry
+from ..events import clock
+
+
+class ZipBundleReader(ArchiveReader):
+    """
+    The zip archive cx_Freeze and py2app bundle the modules in
+    (library.zip, pythonXY.zip), on its own or appended to an executable.
+
+    The central directory is parsed straight from the mapped file, stored
+    members are returned as views into the mapping and deflated ones are
+    decompressed over threads, big data members are streamed. Members
+    are .pyc files with their header, they are returned as they are.
+
+    Type codes are those of a CArchive: 'M' for a package __init__, 'm'
+    for any other module, 'x' for data.
+    """
+    MAGIC = b'PK\005\006'
+    _eocd = struct.Struct('<4sHHHHIIH')
+    _zip64_locator = struct.Struct('<4sIQI')
+    _zip64_eocd = struct.Struct('<4sQHHIIQQQQ')
+    _entry = struct.Struct('<4sHHHHHHIIIHHHHHII')
+    _local = struct.Struct('<4sHHHHHIIIHH')
+    # the end record is followed by a comment of up to 64 KB
+    TAIL_SIZE = _eocd.size + 0xffff
+
+    STORED = 0
+    DEFLATED = 8
+    # members are mostly .pyc files of a few KB
+    INFLATE_BATCH = 64
+
+    def __init__(self, path, fp=None, use_mmap=True, threads=1, events=None):
+        """
+        use_mmap     map the file, on by default: the members are read
+                     in place.
+        """
+        super(ZipBundleReader, self).__init__(path, 0, fp, use_mmap=use_mmap, threads=threads, events=events)
+
+    def _file_size(self):
+        if self.mapping is not None:
+            return len(self.mapping)
+        self.file.seek(0, 2)
+        return self.file.tell()
+
+    def checkmagic(self):
+        """
+        Find the end of central directory record, and with it where the
+        directory is and where the zip starts in the file.
+        """
+        size = self._file_size()
+        tail_start = max(0, size - self.TAIL_SIZE)
+        tail = bytes(self.read_at(tail_start, size - tail_start))
+        pos = tail.rfind(self.MAGIC)
+        if pos < 0 or len(tail) - pos < self._eocd.size:
+            raise RuntimeError("%s is not a zip archive" % self.path)
+        eocd_pos = tail_start + pos
+        fields = self._eocd.unpack(tail[pos:pos + self._eocd.size])
+        self.entries, self.dirsize, dirpos = fields[4], fields[5], fields[6]
+        locator_pos = eocd_pos - self._zip64_locator.size
+        if 0xffffffff in (self.dirsize, dirpos) or self.entries == 0xffff:
+            record_pos = self._zip64_record(locator_pos)
+            if record_pos is not None:
+                record = self._zip64_eocd.unpack(bytes(self.read_at(record_pos, self._zip64_eocd.size)))
+                self.entries, self.dirsize, dirpos = record[7], record[8], record[9]
+                eocd_pos = record_pos
+        # offsets are relative to the start of the zip, which may follow
+        # an executable: the directory ends right before the end record
+        self.dirpos = eocd_pos - self.dirsize
+        self.start = self.dirpos - dirpos
+        if self.start < 0:
+            raise RuntimeError("%s: bad zip central directory" % self.path)
+
+    def _zip64_record(self, locator_pos):
+        """
+        Position in the file of the zip64 end of central directory record,
+        None if there is no zip64 locator at locator_pos. The locator has
+        the offset of the record relative to the zip, which may follow an
+        executable: the record is looked for right before the locator
+        first, where it is unless it has extensible data.
+        """
+        if locator_pos < 0:
+            return None
+        locator = self._zip64_locator.unpack(bytes(self.read_at(locator_pos, self._zip64_locator.size)))
+        if locator[0] != b'PK\006\007':
+            return None
+        for record_pos in (locator_pos - self._zip64_eocd.size, locator[2]):
+            if record_pos >= 0 and bytes(self.read_at(record_pos, 4)) == b'PK\006\006':
+                return record_pos
+        raise RuntimeError("%s: bad zip64 end of central directory" % self.path)
+
+    def loadtoc(self):
+        """
+        The TOC is a list of (name, method, flags, csize, usize, offset),
+        offset being that of the local header, relative to the zip.
+        """
+        directory = bytes(self.read_at(self.dirpos, self.dirsize))
+        entry_size = self._entry.size
+        toc = []
+        pos = 0
+        while pos + entry_size <= len(directory):
+            fields = self._entry.unpack(directory[pos:pos + entry_size])
+            if fields[0] != b'PK\001\002':
+                break
+            flags, method, csize, usize = fields[3], fields[4], fields[8], fields[9]
+            name_len, extra_len, comment_len, offset = fields[10], fields[11], fields[12], fields[16]
+            name = directory[pos + entry_size:pos + entry_size + name_len].decode(
+                "utf-8" if flags & 0x800 else "cp437")
+            if 0xffffffff in (csize, usize, offset):
+                csize, usize, offset = self._zip64_sizes(
+                    directory[pos + entry_size + name_len:pos + entry_size + name_len + extra_len],
+                    csize, usize, offset)
+            if not name.endswith('/'):
+                toc.append((name, method, flags, csize, usize, offset))
+            pos += entry_size + name_len + extra_len + comment_len
+        self.toc = toc
+
+    @staticmethod
+    def _zip64_sizes(extra, csize, usize, offset):
+        # the zip64 extra field holds the fields that overflowed, in order
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, size = struct.unpack('<HH', extra[pos:pos + 4])
+            if tag == 1:
+                values = list(struct.unpack('<%dQ' % (size // 8), extra[pos + 4:pos + 4 + size - size % 8]))
+                if usize == 0xffffffff and values:
+                    usize = values.pop(0)
+                if csize == 0xffffffff and values:
+                    csize = values.pop(0)
+                if offset == 0xffffffff and values:
+                    offset = values.pop(0)
+                break
+            pos += 4 + size
+        return csize, usize, offset
+
+    @staticmethod
+    def typecode(name):
+        """
+        CArchive type code of the member name.
+        """
+        if name.endswith(('.pyc', '.pyo')):
+            return 'M' if name.rsplit('/', 1)[-1].startswith('__init__.') else 'm'
+        return 'x'
+
+    def _raw(self, entry):
+        name, method, flags, csize, usize, offset = entry
+        if flags & 0x1:
+            raise RuntimeError("zip member '%s' is encrypted" % name)
+        pos = self.start + offset
+        # the local header has its own name and extra lengths
+        header = self._local.unpack(bytes(self.read_at(pos, self._local.size)))
+        pos += self._local.size + header[9] + header[10]
+        if max(csize, usize) > self.STREAM_THRESHOLD and self.typecode(name) == 'x' \
+                and method in (self.STORED, self.DEFLATED):
+            return StreamedEntry(self, name, pos, csize, usize, -15 if method == self.DEFLATED else None)
+        return self.read_at(pos, csize)
+
+    def _inflate(self, item):
+        entry, data = item
+        name, method, flags, csize, usize, offset = entry
+        if isinstance(data, StreamedEntry):
+            return item
+        if method == self.DEFLATED:
+            started = clock()
+            data = zlib.decompress(bytes(data), -15)
+            self.events.add("decompress", clock() - started, len(data), name)
+        elif method != self.STORED:
+            raise RuntimeError("zip member '%s' uses unsupported compression method %d" % (name, method))
+        return entry, data
+
+    def _selected(self, select):
+        if select is None:
+            return self.toc
+        return [entry for entry in self.toc if select(self.typecode(entry[0]), entry[0])]
+
+    def iter_toc(self):
+        for name, method, flags, csize, usize, offset in self.toc:
+            yield None, self.typecode(name), name, csize, usize
+
+    def iter_digests(self, select=None, content=False):
+        items = ((entry, self._raw(entry)) for entry in self._selected(select))
+        if content:
+            items = utils.ordered_map(self._inflate, items, self.threads, batch=self.INFLATE_BATCH)
+        for entry, data in items:
+            if isinstance(data, StreamedEntry):
+                digest = data.digest(inflate=content)
+            else:
+                digest = hashlib.sha1(data).hexdigest()
+            yield None, self.typecode(entry[0]), entry[0], digest
+
+    def iter_extract(self, select=None):
+        # raw reads stay in this thread, only the decompression is spread
+        raw = ((entry, self._raw(entry)) for entry in self._selected(select))
+        for entry, data in utils.ordered_map(self._inflate, raw, self.threads, batch=self.INFLATE_BATCH):
+            name, method, flags, csize, usize, offset = entry
+            typcd = self.typecode(name)
+            if self.events.active:
+                self.events.emit("entry", archive=self.path, pos=offset, length=csize, ulen=usize, method=method,
+                                 typcd=typcd, name=name)
+            yield typcd, name, data
@@ -0,0 +1,161 @@
+# encoding: utf-8
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+try:
+    import pkg_resources
+    DECOMPILER_VERSION = pkg_resources.get_distribution("uncompyle6").version
+except Exception:
+    # the version is part of every key, without it a cache could serve the
+    # output of another decompiler: the cache is disabled, see open_cache()
+    DECOMPILER_VERSION = None
+
+
+# the marshalled code object starts after a 8 (py2, <3.3), 12 (3.3-3.6)
+# or 16 (3.7+) byte header
+_HEADER_SIZES = (8, 12, 16)
+
+
+def code_offset(data):
+    """
+    Offset of the marshalled code object in the .pyc bytes data.
+
+    The first candidate that looks like a code object is taken, if the
+    header happens to contain such a byte we hash a bit more than needed,
+    which costs a cache miss but never a wrong hit.
+    """
+    for size in _HEADER_SIZES:
+        if len(data) > size and ord(data[size:size + 1]) & 0x7f == ord('c'):
+            return size
+    return 0
+
+
+def content_key(data, **options):
+    """
+    Hash of the .pyc bytes data that ignores the header fields besides
+    the magic, and of the decompiler version and options. Without a
+    known version the key still identifies a module within one run,
+    which is all the deduplication of a Fleet needs.
+    """
+    digest = hashlib.sha1()
+    digest.update((DECOMPILER_VERSION or "").encode("utf-8"))
+    digest.update(repr(sorted(options.items())).encode("utf-8"))
+    digest.update(data[:4])
+    digest.update(data[code_offset(data):])
+    return digest.hexdigest()
+
+
+def open_cache(cachedir=None, max_size=None):
+    """
+    The DecompileCache at cachedir, None (no caching) if the version of
+    the decompiler cannot be read.
+    """
+    if DECOMPILER_VERSION is None:
+        sys.stdout.write("[ cache disabled ] the uncompyle6 version is unknown\n")
+        return None
+    return DecompileCache(cachedir, max_size)
+
+
+class DecompileCache(object):
+    """
+    On-disk, content-addressed store of decompiled sources.
+
+    Entries are keyed by a hash of the decompiler version, the bytecode
+    magic and the marshalled code object, so the same module found in
+    another build (or another binary) is decompiled only once. The least
+    recently used entries are evicted once the cache grows beyond
+    max_size MB.
+
+    Instances only hold a path, they can be passed to pool workers.
+    """
+    DEFAULT_MAX_SIZE = 1024  # MB
+
+    def __init__(self, cachedir=None, max_size=None):
+        if cachedir is None:
+            cachedir = os.path.join(os.path.expanduser("~"), ".cache", "unfreezePy")
+        self.cachedir = os.path.abspath(cachedir)
+        self.max_size = (max_size or self.DEFAULT_MAX_SIZE) * 1024 * 1024
+        if not os.path.exists(self.cachedir):
+            os.makedirs(self.cachedir)
+
+    def key(self, data, **options):
+        """
+        Cache key of the .pyc bytes data decompiled with options.
+        """
+        return content_key(data, **options)
+
+    def key_for(self, file, **options):
+        with open(file, 'rb') as f:
+            return self.key(f.read(), **options)
+
+    def _path(self, key):
+        return os.path.join(self.cachedir, key[:2], key + ".py")
+
+    def fetch(self, key, dst_fpath):
+        """
+        Copy the cached source for key to dst_fpath.
+
+        Returns True on a hit.
+        """
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, dst_fpath)
+        except (IOError, OSError):
+            return False
+        # the mtime is the recency used for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, src_fpath):
+        """
+        Add the decompiled source src_fpath under key.
+        """
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another worker meanwhile
+                pass
+        # write aside and rename, concurrent workers never see a partial entry
+        fd, tmp_fpath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(src_fpath, tmp_fpath)
+            os.rename(tmp_fpath, path)
+        except (IOError, OSError):
+            if os.path.exists(tmp_fpath):
+                os.remove(tmp_fpath)
+
+    def prune(self):
+        """
+        Evict least recently used entries until the cache fits max_size.
+        """
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self.cachedir):
+            for x in files:
+                path = os.path.join(root, x)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
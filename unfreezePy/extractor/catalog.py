@@ -0,0 +1,327 @@
+# encoding: utf-8
+
+import argparse
+import fnmatch
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from .app.cxFreeze.readers import CxFreezeReader
+from .app.py2app.readers import Py2appReader
+from .app.pyinstaller.readers import CArchiveReader, ZlibArchiveReader
+from .diff import CODE_TYPES
+from .fleet import list_binaries
+from .formats import detect
+
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE binaries (
+    id INTEGER PRIMARY KEY,
+    sha1 TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    format TEXT,
+    pyvers INTEGER,
+    pylib_name TEXT,
+    pkg_start INTEGER,
+    toc_pos INTEGER,
+    toc_len INTEGER,
+    scanned REAL
+);
+CREATE TABLE files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    binary INTEGER REFERENCES binaries(id)
+);
+CREATE TABLE entries (
+    binary INTEGER REFERENCES binaries(id),
+    archive TEXT,
+    typcd TEXT,
+    name TEXT,
+    length INTEGER,
+    ulen INTEGER,
+    digest TEXT
+);
+CREATE TABLE packages (
+    binary INTEGER REFERENCES binaries(id),
+    name TEXT,
+    version TEXT
+);
+CREATE INDEX files_binary ON files(binary);
+CREATE INDEX entries_binary ON entries(binary);
+CREATE INDEX entries_name ON entries(name);
+CREATE INDEX entries_digest ON entries(digest);
+CREATE INDEX packages_name ON packages(name);
+"""
+
+# name-version.dist-info/..., name-version-pyX.Y.egg-info/...
+_DIST_INFO = re.compile(r'(?:^|[/\\])([A-Za-z0-9_.]+?)-([0-9][^-/\\]*?)(?:-py\d+(?:\.\d+)?)?'
+                        r'\.(?:dist|egg)-info(?:[/\\]|$)')
+
+
+def package_name(name):
+    """
+    Normalised distribution name, 'Foo_Bar' and 'foo-bar' are the same.
+    """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _open_pyinstaller(path):
+    if path.lower().endswith(".pyz"):
+        return ZlibArchiveReader(path, use_mmap=True)
+    return CArchiveReader(path, use_mmap=True)
+
+
+# format name -> opener of its reader, see formats.FORMATS
+READERS = {
+    "pyinstaller": _open_pyinstaller,
+    "cxFreeze": CxFreezeReader.open,
+    "py2app": Py2appReader.open,
+}
+
+
+class Catalog(object):
+    """
+    SQLite index of scanned binaries: the cookie of each, the entries of
+    its archives and their hashes, and the distributions it bundles
+    metadata of. Questions about binaries already scanned are answered
+    from the index alone.
+
+    Binaries are keyed by the sha1 of the file. A path whose size and
+    mtime did not change since it was added is not read again, a copy of
+    a binary already known is hashed but not parsed again.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(os.path.expanduser("~"), ".cache", "unfreezePy", "catalog.sqlite")
+        self.path = os.path.abspath(path)
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(self.path)
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0:
+            self.db.executescript(_SCHEMA)
+            self.db.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+            self.db.commit()
+        elif version != SCHEMA_VERSION:
+            raise RuntimeError("%s: catalogue schema %d, expected %d" % (self.path, version, SCHEMA_VERSION))
+
+    def close(self):
+        self.db.close()
+
+    def add(self, fpath):
+        """
+        Index the binary fpath, unless it is there already.
+
+        Returns "unchanged", "known" (another path of a binary already
+        indexed), "added", or None for a file of no supported format.
+        """
+        fpath = os.path.abspath(fpath)
+        st = os.stat(fpath)
+        row = self.db.execute("SELECT size, mtime FROM files WHERE path = ?", (fpath,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime:
+            return "unchanged"
+        sha1 = file_sha1(fpath)
+        row = self.db.execute("SELECT id FROM binaries WHERE sha1 = ?", (sha1,)).fetchone()
+        status = "known"
+        with self.db:
+            if row is None:
+                binary = self._add_binary(fpath, sha1, st.st_size)
+                if binary is None:
+                    return None
+                status = "added"
+            else:
+                binary = row[0]
+            self.db.execute("INSERT OR REPLACE INTO files (path, size, mtime, binary) VALUES (?, ?, ?, ?)",
+                            (fpath, st.st_size, st.st_mtime, binary))
+        return status
+
+    def _add_binary(self, fpath, sha1, size):
+        product, _extractor_cls = detect(fpath)
+        opener = READERS.get(product)
+        if opener is None:
+            return None
+        reader = opener(fpath)
+        try:
+            pylib_name = getattr(reader, "pylib_name", None)
+            if isinstance(pylib_name, bytes):
+                pylib_name = pylib_name.decode("utf-8", "replace")
+            cursor = self.db.execute(
+                "INSERT INTO binaries (sha1, size, format, pyvers, pylib_name, pkg_start, toc_pos, toc_len, scanned) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha1, size, product, getattr(reader, "pyvers", None), pylib_name, getattr(reader, "pkg_start", None),
+                 getattr(reader, "tocpos", None), getattr(reader, "toclen", None), time.time()))
+            binary = cursor.lastrowid
+            # the hashes of the data as stored, nothing is decompressed but the
+            # embedded PYZ archives
+            digests = dict(((archive, name), digest) for archive, typcd, name, digest in reader.iter_digests())
+            entries = []
+            packages = set()
+            for archive, typcd, name, length, ulen in reader.iter_toc():
+                entries.append((binary, archive, typcd, name, length, ulen, digests.get((archive, name))))
+                match = _DIST_INFO.search(name)
+                if match:
+                    packages.add((binary, package_name(match.group(1)), match.group(2)))
+            self.db.executemany("INSERT INTO entries (binary, archive, typcd, name, length, ulen, digest) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)", entries)
+            self.db.executemany("INSERT INTO packages (binary, name, version) VALUES (?, ?, ?)", sorted(packages))
+        finally:
+            reader.close()
+        return binary
+
+    def prune(self):
+        """
+        Forget the paths that are gone and the binaries no path refers to.
+
+        Returns the number of binaries dropped.
+        """
+        with self.db:
+            gone = [(path,) for (path,) in self.db.execute("SELECT path FROM files") if not os.path.exists(path)]
+            self.db.executemany("DELETE FROM files WHERE path = ?", gone)
+            orphans = [(x,) for (x,) in self.db.execute(
+                "SELECT id FROM binaries WHERE id NOT IN (SELECT binary FROM files)")]
+            for table in ("entries", "packages"):
+                self.db.executemany("DELETE FROM %s WHERE binary = ?" % table, orphans)
+            self.db.executemany("DELETE FROM binaries WHERE id = ?", orphans)
+        return len(orphans)
+
+    def binaries(self, pyvers=None, product=None):
+        """
+        (path, format, pyvers, pylib_name, sha1) of the indexed binaries,
+        of the Python version pyvers (e.g. 27) and format product only if
+        given.
+        """
+        query = "SELECT f.path, b.format, b.pyvers, b.pylib_name, b.sha1 FROM files f JOIN binaries b " \
+                "ON f.binary = b.id WHERE 1"
+        params = []
+        if pyvers is not None:
+            query += " AND b.pyvers = ?"
+            params.append(pyvers)
+        if product is not None:
+            query += " AND b.format = ?"
+            params.append(product)
+        return self.db.execute(query + " ORDER BY f.path", params).fetchall()
+
+    def find(self, pattern, types=None):
+        """
+        (path, archive, typcd, name) of the entries whose name matches the
+        glob pattern, of the type codes types only if given.
+        """
+        query = "SELECT f.path, e.archive, e.typcd, e.name FROM entries e JOIN files f ON f.binary = e.binary " \
+                "WHERE e.name GLOB ?"
+        params = [pattern]
+        if types:
+            query += " AND e.typcd IN (%s)" % ", ".join("?" * len(types))
+            params.extend(types)
+        return self.db.execute(query + " ORDER BY f.path, e.name", params).fetchall()
+
+    def where(self, digest):
+        """
+        (path, archive, typcd, name) of the entries stored with the sha1
+        digest, see ArchiveReader.iter_digests().
+        """
+        return self.db.execute("SELECT f.path, e.archive, e.typcd, e.name FROM entries e JOIN files f "
+                               "ON f.binary = e.binary WHERE e.digest = ? ORDER BY f.path, e.name",
+                               (digest,)).fetchall()
+
+    def packages(self, name, version=None):
+        """
+        (path, version) of the binaries bundling the distribution name,
+        version being None where only its modules are bundled, not its
+        metadata. version, a glob, limits this to the matching versions.
+        """
+        name = package_name(name)
+        rows = self.db.execute("SELECT f.path, p.version FROM packages p JOIN files f ON f.binary = p.binary "
+                               "WHERE p.name = ?", (name,)).fetchall()
+        if version is None:
+            # binaries with the modules of a package of that name, but no
+            # metadata
+            module = name.replace('-', '_')
+            types = ", ".join("?" * len(CODE_TYPES))
+            # one lookup per name form, an OR would not use the index
+            modules = "SELECT binary FROM entries WHERE name = ? AND typcd IN (%s) UNION " \
+                      "SELECT binary FROM entries WHERE name GLOB ? AND typcd IN (%s)" % (types, types)
+            rows.extend(self.db.execute(
+                "SELECT path, NULL FROM files WHERE binary IN (%s) AND binary NOT IN "
+                "(SELECT binary FROM packages WHERE name = ?)" % modules,
+                (module,) + tuple(CODE_TYPES) + (module + ".*",) + tuple(CODE_TYPES) + (name,)).fetchall())
+        else:
+            rows = [row for row in rows if fnmatch.fnmatchcase(row[1], version)]
+        return sorted(set(rows), key=lambda row: (row[0], row[1] or ""))
+
+
+def _print_rows(rows):
+    for row in rows:
+        sys.stdout.write("\t".join(u"" if x is None else u"%s" % x for x in row) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="index scanned binaries and query the index")
+    parser.add_argument('--db', default=None, action='store',
+                        dest='db', help='catalogue file, ~/.cache/unfreezePy/catalog.sqlite by default')
+    commands = parser.add_subparsers(dest='command')
+    add = commands.add_parser('add', help='index binaries, directories or manifest files of them')
+    add.add_argument('-b', '--batch', default=False, action='store_true',
+                     dest='batch', help='the paths are directories or manifest files of binaries')
+    add.add_argument('paths', metavar='PATH', nargs='+')
+    commands.add_parser('prune', help='forget binaries whose files are gone')
+    binaries = commands.add_parser('binaries', help='list the indexed binaries')
+    binaries.add_argument('--pyvers', default=None, type=int,
+                          dest='pyvers', help='only those built with this Python version, e.g. 27')
+    binaries.add_argument('--format', default=None, action='store',
+                          dest='product', help='only those of this format, e.g. pyinstaller')
+    find = commands.add_parser('find', help='entries whose name matches a glob')
+    find.add_argument('--types', default=None, action='store', metavar='CODES',
+                      dest='types', help='only entries of these type codes, e.g. mMs')
+    find.add_argument('pattern')
+    where = commands.add_parser('where', help='entries stored with a sha1 digest')
+    where.add_argument('digest')
+    packages = commands.add_parser('package', help='binaries bundling a distribution')
+    packages.add_argument('name')
+    packages.add_argument('version', nargs='?', default=None, help='version glob, e.g. 2.*')
+    args = parser.parse_args()
+
+    catalog = Catalog(args.db)
+    try:
+        if args.command == 'add':
+            paths = [x for path in args.paths for x in list_binaries(path)] if args.batch else args.paths
+            for path in paths:
+                try:
+                    status = catalog.add(path)
+                except Exception as e:
+                    status = "error: %s" % e
+                sys.stdout.write("[ catalog ] %s : %s\n" % (path, status or "no supported format"))
+        elif args.command == 'prune':
+            sys.stdout.write("[ catalog ] %d binaries dropped\n" % catalog.prune())
+        elif args.command == 'binaries':
+            _print_rows(catalog.binaries(args.pyvers, args.product))
+        elif args.command == 'find':
+            _print_rows(catalog.find(args.pattern, args.types))
+        elif args.command == 'where':
+            _print_rows(catalog.where(args.digest))
+        elif args.command == 'package':
+            _print_rows(catalog.packages(args.name, args.version))
+    finally:
+        catalog.close()
+
+
+if __name__ == '__main__':
+    main()
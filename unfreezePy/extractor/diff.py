@@ -0,0 +1,92 @@
+# encoding: utf-8
+
+import json
+import sys
+
+from .events import clock
+
+
+REPORT_NAME = "diff-report.json"
+
+# entries holding code, the ones worth decompiling
+CODE_TYPES = "mMs"
+
+
+def _entry(key, typcd):
+    archive, name = key
+    return {"archive": archive, "typcd": typcd, "name": name}
+
+
+def _digests(reader, select=None, content=False):
+    return dict(((archive, name), (typcd, digest))
+                for archive, typcd, name, digest in reader.iter_digests(select, content))
+
+
+def diff_readers(old, new):
+    """
+    Compare two builds entry by entry, by the hash of their data, reading
+    the archives but extracting nothing.
+
+    Entries whose stored bytes differ (another compression level, the
+    random IV of an encrypted PYZ) are compared again by their content.
+
+    Returns a dict of the added, removed and changed entries, each a list
+    of {archive, typcd, name} dicts, and the count of unchanged ones.
+    """
+    before, after = _digests(old), _digests(new)
+    candidates = [key for key in after if key in before and after[key][1] != before[key][1]]
+    if candidates:
+        names = set(name for archive, name in candidates)
+        select = lambda typcd, name: typcd.lower() == 'z' or name in names
+        before_content, after_content = _digests(old, select, True), _digests(new, select, True)
+        changed = [key for key in candidates if before_content.get(key) != after_content.get(key)]
+    else:
+        changed = []
+    added = [key for key in after if key not in before]
+    removed = [key for key in before if key not in after]
+    return {
+        "added": [_entry(key, after[key][0]) for key in sorted(added)],
+        "removed": [_entry(key, before[key][0]) for key in sorted(removed)],
+        "changed": [_entry(key, after[key][0]) for key in sorted(changed)],
+        "unchanged": len(after) - len(added) - len(changed),
+    }
+
+
+def diff_binaries(extractor_cls, old_fpath, new_fpath, decompile=True, **options):
+    """
+    Diff the build old_fpath against new_fpath, then unfreeze only the
+    modules of new_fpath that were added or changed.
+
+    The report (REPORT_NAME) goes to the output of new_fpath, next to
+    the decompiled modules. Returns it.
+    """
+    new = extractor_cls(new_fpath, **options)
+    try:
+        options.pop("outputdir", None)
+        old = extractor_cls(old_fpath, **options)
+        try:
+            started = clock()
+            report = diff_readers(old.reader, new.reader)
+            new.events.add("diff", clock() - started, name=new_fpath)
+        finally:
+            old.close()
+        report["old"] = old_fpath
+        report["new"] = new_fpath
+
+        for sign, kind in (("+", "added"), ("-", "removed"), ("~", "changed")):
+            for entry in report[kind]:
+                sys.stdout.write("%s %-2s %s%s\n" % (sign, entry["typcd"], "    " if entry["archive"] else "",
+                                                     entry["name"]))
+        sys.stdout.write("[ diff ] %d added, %d removed, %d changed, %d unchanged\n" % (
+            len(report["added"]), len(report["removed"]), len(report["changed"]), report["unchanged"]))
+
+        modules = set(entry["name"] for entry in report["added"] + report["changed"]
+                      if entry["typcd"] in CODE_TYPES)
+        report["decompiled"] = {}
+        if decompile and modules:
+            new.select = lambda typcd, name: typcd.lower() == 'z' or (typcd in CODE_TYPES and name in modules)
+            report["decompiled"] = new.unfreeze()
+        new.sink.write(REPORT_NAME, json.dumps(report, indent=2, sort_keys=True).encode("utf-8"))
+    finally:
+        new.close()
+    return report
@@ -0,0 +1,127 @@
+# encoding: utf-8
+
+import heapq
+import json
+import sys
+import threading
+import timeit
+
+# wall clock with the best resolution available, for stage timers
+clock = timeit.default_timer
+
+MODES = ("quiet", "summary", "events")
+
+
+class EventStream(object):
+    """
+    Progress events and per-stage timers of an unfreeze run.
+
+    Stages (toc, decrypt, decompress, unmarshal, write, decompile, ...)
+    accumulate seconds, bytes and entry counts whatever the mode, that is
+    cheap enough for the hot loops.
+
+    mode     "quiet" only keeps the timers, "summary" writes a table of
+             the stages on close(), "events" also writes every event as a
+             JSON line.
+    stream   file the output goes to, stdout by default.
+    hooks    callables hook(event), called with every event dict in any
+             mode.
+
+    Events are buffered and written BUFFER at a time. The stream may be
+    used from several threads.
+    """
+    BUFFER = 256
+    # slowest entries kept per stage for the summary
+    SLOWEST = 5
+
+    def __init__(self, mode="quiet", stream=None, hooks=None):
+        if mode not in MODES:
+            raise ValueError("unknown progress mode %r" % mode)
+        self.mode = mode
+        self.stream = stream or sys.stdout
+        self.hooks = list(hooks or ())
+        # False when events would go nowhere, callers skip building them
+        self.active = mode == "events" or bool(self.hooks)
+        self.started = clock()
+        self.stages = {}
+        self.slowest = {}
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        if not self.active:
+            return
+        fields["event"] = event
+        fields["t"] = round(clock() - self.started, 6)
+        for hook in self.hooks:
+            hook(fields)
+        if self.mode == "events":
+            with self._lock:
+                self._buffer.append(fields)
+                if len(self._buffer) >= self.BUFFER:
+                    self._flush()
+
+    def add(self, stage, seconds, nbytes=0, name=None, **fields):
+        """
+        Account seconds and nbytes to stage for one entry, name being the
+        entry, and emit it as an event.
+        """
+        with self._lock:
+            totals = self.stages.get(stage)
+            if totals is None:
+                totals = self.stages[stage] = [0.0, 0, 0]
+            totals[0] += seconds
+            totals[1] += nbytes
+            totals[2] += 1
+            if name is not None:
+                slowest = self.slowest.setdefault(stage, [])
+                if len(slowest) < self.SLOWEST:
+                    heapq.heappush(slowest, (seconds, name))
+                elif seconds > slowest[0][0]:
+                    heapq.heapreplace(slowest, (seconds, name))
+        if self.active:
+            self.emit(stage, name=name, seconds=round(seconds, 6), bytes=nbytes, **fields)
+
+    def _flush(self):
+        buffered, self._buffer = self._buffer, []
+        self.stream.write("".join(json.dumps(x, sort_keys=True) + "\n" for x in buffered))
+
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                self._flush()
+        self.stream.flush()
+
+    def summary(self):
+        """
+        The totals per stage: seconds, bytes, count and slowest entries.
+        """
+        with self._lock:
+            return dict((stage, {
+                "seconds": seconds,
+                "bytes": nbytes,
+                "count": count,
+                "slowest": [[name, s] for s, name in sorted(self.slowest.get(stage, ()), reverse=True)],
+            }) for stage, (seconds, nbytes, count) in self.stages.items())
+
+    def close(self):
+        """
+        Flush the pending events and, unless quiet, write the summary.
+
+        Returns the summary.
+        """
+        summary = self.summary()
+        if self.mode == "events":
+            self.emit("summary", stages=summary, elapsed=clock() - self.started)
+        elif self.mode == "summary":
+            for stage in sorted(summary, key=lambda x: -summary[x]["seconds"]):
+                totals = summary[stage]
+                self.stream.write("[ stage ] %-12s %9.3fs %10.1f MB %8d entries\n" % (
+                    stage, totals["seconds"], totals["bytes"] / 1e6, totals["count"]))
+                if stage != "decompile":
+                    continue
+                for name, seconds in totals["slowest"]:
+                    self.stream.write("\t%9.3fs %s\n" % (seconds, name))
+            self.stream.write("[ stage ] elapsed %.3fs\n" % (clock() - self.started))
+        self.flush()
+        return summary
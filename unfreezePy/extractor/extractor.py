@@ -2,76 +2,370 @@
 
 import os,sys
 import codecs
+import fnmatch
 import multiprocessing
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    # Python 3
+    import queue
 
 import uncompyle6
+try:
+    from xdis.disasm import disassemble_file
+except ImportError:
+    # xdis 4.x and earlier
+    from xdis.main import disassemble_file
+
+from .cache import open_cache
+from .events import EventStream, clock
+from .fingerprint import FingerprintIndex, lookup_pyc
+from .sinks import make_sink
+from .workers import Retry, WorkerPool, largest_first, queued_largest_first
+
 
+def default_handle_decompile(file, pyc_persist=True, cache=None, **options):
+    """
+    Decompile one .pyc next to itself, reusing the output of an identical
+    module from cache (a DecompileCache) when there is one.
 
-def default_handle_decompile(file, pyc_persist=True, **options):
+    Returns (file, error), error is None on success.
+    """
     if os.path.isfile(file) and file.endswith(".pyc"):
-        # FIXME: stdout or logging ?
-        sys.stdout.write("[ decompile ] %s \n" % file)
         dst_fpath = file[:-1]
-        try:
-            uncompyle6.decompile_file(file, codecs.open(dst_fpath, 'wb', encoding="utf-8"), **options)
-        except Exception as e:
-            sys.stdout.write("uncompyle error: %s \n" % e)
+        key = cache.key_for(file, **options) if cache is not None else None
+        if key is None or not cache.fetch(key, dst_fpath):
+            try:
+                with codecs.open(dst_fpath, 'wb', encoding="utf-8") as f:
+                    uncompyle6.decompile_file(file, f, **options)
+            except MemoryError:
+                raise
+            except Exception as e:
+                return file, str(e)
+            if key is not None:
+                cache.store(key, dst_fpath)
+        if not pyc_persist:
+            try:
+                os.remove(file)
+            except:
+                pass
+    return file, None
+
+
+def default_handle_disassemble(file, **options):
+    """
+    Fallback for a .pyc that could not be decompiled within budget: write
+    an xdis disassembly listing next to it as <name>.dis.
+
+    Returns (file, error), error is None on success.
+    """
+    # a killed decompile leaves a truncated source behind
+    if os.path.isfile(file[:-1]):
+        os.remove(file[:-1])
+    dst_fpath = os.path.splitext(file)[0] + ".dis"
+    try:
+        with codecs.open(dst_fpath, 'wb', encoding="utf-8") as f:
+            disassemble_file(file, f)
+    except Exception as e:
+        return file, str(e)
+    return file, None
+
+
+class FallbackHandler(object):
+    """
+    Stands in for handle_decompile in the job of a module whose decompile
+    went over budget: runs handle_fallback on it instead, in a worker like
+    any other job. Picklable if handle_fallback is.
+    """
+
+    def __init__(self, handle_fallback, reason):
+        self.handle_fallback = handle_fallback
+        self.reason = reason
+
+    def __call__(self, file, pyc_persist=True, cache=None):
+        _, error = self.handle_fallback(file)
+        if error is None:
+            return file, "%s, disassembled instead" % self.reason
+        return file, "%s, disassembly failed: %s" % (self.reason, error)
+
+
+def fallback_result(handle_fallback, job, reason, events=None):
+    """
+    on_budget of the decompile pools: a decompile job that went over
+    budget is retried as a job running handle_fallback on its file, under
+    the same budget. Nothing runs in the parent, a fallback over budget
+    itself only gets its failure recorded.
+    """
+    handle_decompile, file, pyc_persist, _cache = job
+    if events is not None:
+        events.emit("over_budget", name=file, reason=reason)
+    if isinstance(handle_decompile, FallbackHandler):
+        return file, "%s, disassembly failed: %s" % (handle_decompile.reason, reason)
+    return Retry((FallbackHandler(handle_fallback, reason), file, pyc_persist, None))
+
+
+def make_select(patterns=None, types=None):
+    """
+    Entry filter for ArchiveReader.iter_extract(): keep the entries whose
+    name matches one of the glob patterns and whose type code is in types.
+    Embedded archives ('z', 'Z') are only checked against types, so that
+    their members can still match the patterns.
+    """
+    def select(typcd, name):
+        if types and typcd not in types:
+            return False
+        if typcd.lower() == 'z' or not patterns:
+            return True
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+    return select
+
+
+def pyc_cost(file):
+    """
+    Estimated decompile cost of a .pyc, its size: that of the
+    uncompressed entry.
+    """
+    try:
+        return os.path.getsize(file)
+    except OSError:
+        return 0
+
+
+def _decompile_job(args):
+    # pool workers only get picklable arguments, unpack them here
+    handle_decompile, file, pyc_persist, cache = args
+    try:
+        if cache is not None:
+            result = handle_decompile(file, pyc_persist, cache=cache)
         else:
-            if not pyc_persist:
-                try:
-                    os.remove(file)
-                except:
-                    pass
+            result = handle_decompile(file, pyc_persist)
+    except MemoryError:
+        # the worker pool replaces the process and falls back
+        raise
+    except Exception as e:
+        return file, str(e)
+    # custom handlers may not report anything
+    return result if result is not None else (file, None)
 
 
 class ArchiveExtractor(object):
+    # .pyc files extract() may run ahead of the decompile workers in unfreeze()
+    QUEUE_DEPTH = 16
 
     def __init__(self, fpath, key="", outputdir=None, reader=None, pyc_persist=True, multiproc=True,
-                 handle_decompile=default_handle_decompile, **kwargs):
+                 workers=None, timeout=None, max_memory=None, maxtasks=None, cache_dir=None, cache_size=None,
+                 fingerprints=None, known_modules="skip", only=None, types=None, events=None, sink=None,
+                 handle_decompile=default_handle_decompile, handle_fallback=default_handle_disassemble, **kwargs):
+        """
+        timeout      wall-clock seconds one module may take to decompile.
+        max_memory   memory budget of a decompile worker in MB.
+        maxtasks     recycle a decompile worker after this many modules.
+        cache_dir    directory of a DecompileCache shared between runs,
+                     no cache if None.
+        cache_size   size bound of that cache in MB.
+        fingerprints path of a FingerprintIndex of known modules.
+        known_modules "skip" known modules entirely, or "label" them and
+                     still decompile.
+        only         glob patterns of the entry names to extract.
+        types        type codes of the entries to extract, e.g. "mMsz" for
+                     code only.
+        events       EventStream the progress and stage timers go to, a
+                     quiet one if None.
+        sink         OutputSink the output goes to, by default picked by
+                     make_sink() from outputdir: a directory, or a zip or
+                     tar file.
+
+        A module over budget gets its worker killed and replaced, and is
+        handed to handle_fallback instead. Budgets only apply to the
+        multiprocess mode.
+        """
         self.fpath = fpath
         self.key = key
         self.kwargs = kwargs
         self.reader = reader
         self.pyc_persist = pyc_persist
         self.multiproc = multiproc
+        self.workers = workers or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.maxtasks = maxtasks
         self.handle_decompile = handle_decompile
+        self.handle_fallback = handle_fallback
+        self.cache = open_cache(cache_dir, cache_size) if cache_dir else None
+        self.fingerprints = FingerprintIndex.load(fingerprints) if fingerprints else None
+        self.known_modules = known_modules
+        # path -> label of the known modules met by extract()
+        self.known = {}
+        self.select = make_select(only, types and set(types)) if only or types else None
+        self.events = events if events is not None else EventStream()
 
         if not os.path.isfile(fpath):
             raise NameError("< %s > is an invalid file name!" % fpath)
         if outputdir is None:
             outputdir = os.path.splitext(os.path.basename(fpath))[0] + "-unfreeze"
         self.outputdir = os.path.abspath(outputdir)
+        self.sink = sink if sink is not None else make_sink(self.outputdir)
 
     def extract(self):
         '''
         maybe override
+
+        entries are consumed one by one from the reader, so peak memory
+        is bounded by the largest single entry.
         '''
-        result = self.reader.extract()
-        for typed, path, _data in result:
-            dst_fpath = os.path.join(self.outputdir, path)
-            directory, _ = os.path.split(dst_fpath)
-            if directory and not os.path.exists(directory):
-                os.makedirs(directory)
-            open(dst_fpath, 'wb').write(_data)
+        for _ in self.iter_extract():
+            pass
+
+    def iter_extract(self):
+        """
+        Write the entries of the archive to the sink one at a time and
+        yield the path of every file written. .pyc files are written where
+        the decompiler finds them, below the workdir of the sink.
+        """
+        for typed, path, _data in self.reader.iter_extract(self.select):
+            if self.fingerprints is not None and path.endswith(".pyc"):
+                label = lookup_pyc(self.fingerprints, _data)
+                if label is not None:
+                    self.known[path] = label
+                    if self.known_modules == "skip":
+                        continue
+            started = clock()
+            if path.endswith(".pyc"):
+                dst_fpath = self.sink.stage(path, _data)
+            elif hasattr(_data, "iter_chunks"):
+                # too big to be held in memory, it goes out as it is read
+                self.sink.write_chunks(path, _data.iter_chunks())
+                dst_fpath = os.path.join(self.outputdir, path)
+            else:
+                self.sink.write(path, _data)
+                dst_fpath = os.path.join(self.outputdir, path)
+            self.events.add("write", clock() - started, len(_data), path)
+            yield dst_fpath
+        if self.known:
+            self._write_known_modules()
+
+    def list_toc(self):
+        """
+        Print the table of contents of the archive, entries of embedded
+        archives indented below them. Nothing is extracted.
+
+        Returns the number of entries listed.
+        """
+        count = 0
+        for archive, typcd, name, length, ulen in self.reader.iter_toc():
+            if self.select is not None and not self.select(typcd, name):
+                continue
+            sys.stdout.write("%-2s %10d %10s  %s%s\n" % (typcd, length, "" if ulen is None else ulen,
+                                                        "    " if archive else "", name))
+            count += 1
+        return count
+
+    def _write_known_modules(self):
+        # keep a record of what was recognised, skipped modules leave no other trace
+        sys.stdout.write("[ known modules ] %d %s\n" % (len(self.known),
+                         "skipped" if self.known_modules == "skip" else "labelled"))
+        self.sink.write("known-modules.txt", u"".join(u"%s\t%s\n" % (path, self.known[path])
+                                                     for path in sorted(self.known)).encode("utf-8"))
+
+    def _decompiled(self, job, result, seconds):
+        file, error = result
+        self.events.add("decompile", seconds, name=file, error=error)
 
     def _uncompyle_single_process(self,files):
         for file in files:
-            self.handle_decompile(file, self.pyc_persist)
+            if file is WorkerPool.WAIT:
+                continue
+            job = (self.handle_decompile, file, self.pyc_persist, self.cache)
+            started = clock()
+            result = _decompile_job(job)
+            self._decompiled(job, result, clock() - started)
+            yield result
+
+    def _over_budget(self, job, reason):
+        return fallback_result(self.handle_fallback, job, reason, self.events)
 
     def _uncompyle_multi_proces(self,files):
-        pool = multiprocessing.Pool()
-        for file in files:
-            pool.apply(self.handle_decompile, args=(file,self.pyc_persist))
-        pool.close()
-        pool.join()
+        jobs = (file if file is WorkerPool.WAIT else (self.handle_decompile, file, self.pyc_persist, self.cache)
+                for file in files)
+        pool = WorkerPool(_decompile_job, self.workers, timeout=self.timeout, max_memory=self.max_memory,
+                          maxtasks=self.maxtasks, on_budget=self._over_budget, on_done=self._decompiled)
+        return pool.imap_unordered(jobs)
 
     def uncompyle(self):
+        """
+        Decompile every .pyc extracted so far.
+
+        Returns a dict mapping each file to its error (None on success).
+        """
         # list files
         files_full_path = []
-        for root, dirs, files in os.walk(self.outputdir):
-            files_full_path.extend([os.path.join(root,x) for x in files])
+        for root, dirs, files in os.walk(self.sink.workdir):
+            files_full_path.extend([os.path.join(root,x) for x in files if x.endswith(".pyc")])
+        return self._uncompyle(largest_first(files_full_path, pyc_cost))
+
+    def unfreeze(self):
+        """
+        Extract and decompile in one pass. A reader thread writes the
+        entries and queues every .pyc it wrote, decompile workers pick them
+        up while the rest of the archive is still being read, the largest
+        of those extracted so far first.
+
+        Returns the decompile summary like uncompyle(). An extraction error
+        is raised once the modules extracted so far are decompiled.
+        """
+        files = queue.Queue(self.workers * self.QUEUE_DEPTH)
+        errors = []
+
+        def produce():
+            try:
+                for dst_fpath in self.iter_extract():
+                    if dst_fpath.endswith(".pyc"):
+                        files.put(dst_fpath)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                files.put(None)
+
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+        summary = self._uncompyle(queued_largest_first(files, pyc_cost))
+        producer.join()
+        if errors:
+            raise errors[0]
+        return summary
+
+    def _collect(self, file):
+        # move a decompiled .pyc and its outputs into the sink
+        for output in (file[:-1], os.path.splitext(file)[0] + ".dis"):
+            self.sink.commit(output)
+        return self.sink.commit(file)
+
+    def close(self):
+        """
+        Finish the output, whatever was not decompiled goes to the sink as
+        it is, and close the archive.
+        """
+        try:
+            self.sink.close()
+        finally:
+            self.reader.close()
+
+    def _uncompyle(self, files):
         # decompile
-        if not self.multiproc:
-            self._uncompyle_single_process(files_full_path)
+        if not self.multiproc or self.workers == 1:
+            results = self._uncompyle_single_process(files)
         else:
-            self._uncompyle_multi_proces(files_full_path)
+            results = self._uncompyle_multi_proces(files)
+        summary = dict((self._collect(file), error) for file, error in results)
+        if self.cache is not None:
+            self.cache.prune()
+        failed = sorted(file for file, error in summary.items() if error is not None)
+        sys.stdout.write("[ decompile summary ] %d ok, %d failed\n" % (len(summary) - len(failed), len(failed)))
+        if self.events.mode != "quiet":
+            for file in failed:
+                sys.stdout.write("\t[ failed ] %s : %s\n" % (file, summary[file]))
+        self.events.flush()
+        return summary
@@ -0,0 +1,240 @@
+# encoding: utf-8
+
+import argparse
+import hashlib
+import marshal
+import os
+import struct
+import sys
+
+from .cache import code_offset
+
+try:
+    from imp import get_magic
+except ImportError:
+    # Python 3.12+
+    from importlib.util import MAGIC_NUMBER
+
+    def get_magic():
+        return MAGIC_NUMBER
+
+
+DIGEST_SIZE = 8
+
+# (first, last magic number, python version) of the CPython releases, the
+# release candidates and the magics of app/pyinstaller/utils.PYTHON_MAGIC
+_MAGIC_VERSIONS = (
+    (20121, 20121, (1, 5)),
+    (50428, 50428, (1, 6)),
+    (50823, 50823, (2, 0)),
+    (60202, 60202, (2, 1)),
+    (60717, 60717, (2, 2)),
+    (62011, 62021, (2, 3)),
+    (62041, 62061, (2, 4)),
+    (62071, 62131, (2, 5)),
+    (62151, 62161, (2, 6)),
+    (62171, 62211, (2, 7)),
+    (3000, 3131, (3, 0)),
+    (3141, 3151, (3, 1)),
+    (3160, 3180, (3, 2)),
+    (3190, 3230, (3, 3)),
+    (3250, 3310, (3, 4)),
+    (3320, 3351, (3, 5)),
+    (3360, 3379, (3, 6)),
+    (3390, 3399, (3, 7)),
+    (3400, 3419, (3, 8)),
+    (3420, 3429, (3, 9)),
+    (3430, 3449, (3, 10)),
+    (3450, 3499, (3, 11)),
+    (3500, 3549, (3, 12)),
+    (3550, 3599, (3, 13)),
+)
+
+
+def magic_version(magic):
+    """
+    (major, minor) python version of the bytecode magic, None if it is
+    not a known one.
+    """
+    (number,) = struct.unpack('<H', bytes(magic[:2]))
+    for first, last, version in _MAGIC_VERSIONS:
+        if first <= number <= last:
+            return version
+    return None
+
+
+def _update_const(digest, const):
+    if hasattr(const, 'co_code'):
+        _update_code(digest, const)
+    elif isinstance(const, (tuple, list)):
+        digest.update(b'(')
+        for x in const:
+            _update_const(digest, x)
+        digest.update(b')')
+    elif isinstance(const, (set, frozenset)):
+        # set order depends on string hashing, which may be randomized
+        digest.update(repr(sorted(repr(x) for x in const)).encode('utf-8'))
+    else:
+        digest.update(repr(const).encode('utf-8'))
+
+
+def _update_code(digest, co):
+    # co_filename, co_firstlineno and co_lnotab depend on where and how the
+    # module was built, they are left out
+    digest.update(struct.pack('!ii', co.co_argcount, co.co_flags))
+    digest.update(bytes(co.co_code))
+    for names in (co.co_names, co.co_varnames, co.co_freevars, co.co_cellvars):
+        digest.update(repr(tuple(str(x) for x in names)).encode('utf-8'))
+    digest.update(str(co.co_name).encode('utf-8'))
+    for const in co.co_consts:
+        _update_const(digest, const)
+
+
+def code_fingerprint(co, magic):
+    """
+    Build-independent digest of the code object co compiled for the
+    bytecode magic. Works on native and xdis code objects alike.
+
+    The digest covers the python version of the magic rather than the
+    magic itself: every release of a version, and the headers PyInstaller
+    archives get from utils.PYTHON_MAGIC, share the same fingerprints.
+    """
+    digest = hashlib.sha1()
+    version = magic_version(magic)
+    digest.update(b'%d.%d' % version if version is not None else bytes(magic[:4]))
+    _update_code(digest, co)
+    return digest.digest()[:DIGEST_SIZE]
+
+
+class FingerprintIndex(object):
+    """
+    A set of code object fingerprints of known modules (stdlib, PyPI
+    packages), each with a label such as 'stdlib-2.7' or 'requests-2.18.4'.
+
+    The index file is a label table followed by fixed size
+    (digest, label number) records, ~10 bytes per module. It is loaded
+    into a dict, lookups are O(1). Build one with
+
+        python -m unfreezePy.extractor.fingerprint -o known.fpi stdlib-2.7=/usr/lib/python2.7
+    """
+    # 2: fingerprints of the python version, not of the magic
+    FILE_MAGIC = b'UFPI\x02'
+    _count = struct.Struct('!I')
+    _label_len = struct.Struct('!H')
+    _entry = struct.Struct('!%dsH' % DIGEST_SIZE)
+
+    def __init__(self):
+        self.labels = []
+        self.entries = {}
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(cls.FILE_MAGIC)] != cls.FILE_MAGIC:
+            raise LookupError("%s is not a fingerprint index" % path)
+        p = len(cls.FILE_MAGIC)
+        (nlabels,) = cls._count.unpack_from(data, p)
+        p += cls._count.size
+        for _ in range(nlabels):
+            (length,) = cls._label_len.unpack_from(data, p)
+            p += cls._label_len.size
+            index.labels.append(data[p:p + length].decode('utf-8'))
+            p += length
+        (nentries,) = cls._count.unpack_from(data, p)
+        p += cls._count.size
+        for _ in range(nentries):
+            fp, label = cls._entry.unpack_from(data, p)
+            p += cls._entry.size
+            index.entries[fp] = label
+        return index
+
+    def save(self, path):
+        chunks = [self.FILE_MAGIC, self._count.pack(len(self.labels))]
+        for label in self.labels:
+            label = label.encode('utf-8')
+            chunks.append(self._label_len.pack(len(label)))
+            chunks.append(label)
+        chunks.append(self._count.pack(len(self.entries)))
+        for fp in sorted(self.entries):
+            chunks.append(self._entry.pack(fp, self.entries[fp]))
+        with open(path, 'wb') as f:
+            f.write(b''.join(chunks))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, co, magic, label):
+        if label not in self.labels:
+            self.labels.append(label)
+        self.entries[code_fingerprint(co, magic)] = self.labels.index(label)
+
+    def lookup(self, co, magic):
+        """
+        Return the label of the known module co, None if it is unknown.
+        """
+        label = self.entries.get(code_fingerprint(co, magic))
+        return None if label is None else self.labels[label]
+
+    def add_tree(self, path, label):
+        """
+        Fingerprint every module below path (a stdlib directory or an
+        installed package) with the running interpreter.
+
+        Returns the number of modules added.
+        """
+        magic = get_magic()
+        count = 0
+        for root, dirs, files in os.walk(path):
+            for x in files:
+                if not x.endswith('.py'):
+                    continue
+                fpath = os.path.join(root, x)
+                try:
+                    with open(fpath, 'rb') as f:
+                        co = compile(f.read(), fpath, 'exec')
+                except (SyntaxError, ValueError, TypeError):
+                    # e.g. sources for another major python version
+                    continue
+                self.add(co, magic, label)
+                count += 1
+        return count
+
+
+def lookup_pyc(index, data):
+    """
+    Label of the module in the .pyc bytes data, None if it is unknown or
+    can not be unmarshalled by this interpreter.
+    """
+    try:
+        co = marshal.loads(bytes(data[code_offset(data):]))
+    except (EOFError, ValueError, TypeError):
+        return None
+    if not hasattr(co, 'co_code'):
+        return None
+    return index.lookup(co, data[:4])
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m unfreezePy.extractor.fingerprint",
+                                     description="build a fingerprint index of known modules")
+    parser.add_argument('-o', '--output', required=True, action='store',
+                        dest='output', help='index file to write')
+    parser.add_argument('-a', '--append', default=False, action='store_true',
+                        dest='append', help='add to an existing index')
+    parser.add_argument('trees', metavar='LABEL=PATH', nargs='+',
+                        help='label and directory of a stdlib or package, e.g. requests-2.18.4=site-packages/requests')
+    args = parser.parse_args()
+
+    index = FingerprintIndex.load(args.output) if args.append else FingerprintIndex()
+    for tree in args.trees:
+        label, _, path = tree.partition('=')
+        count = index.add_tree(path, label)
+        sys.stdout.write("[ fingerprint ] %s : %d modules\n" % (label, count))
+    index.save(args.output)
+    sys.stdout.write("[ fingerprint ] %d modules in %s\n" % (len(index), args.output))
+
+
+if __name__ == '__main__':
+    main()
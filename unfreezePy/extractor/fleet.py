@@ -0,0 +1,282 @@
+# encoding: utf-8
+
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    # Python 3
+    import queue
+
+from .cache import content_key
+from .events import EventStream, clock
+from .extractor import _decompile_job, default_handle_disassemble, fallback_result
+from .workers import WorkerPool
+
+
+REPORT_NAME = "unfreeze-report.json"
+
+
+def list_binaries(path):
+    """
+    The binaries of a batch: every file below the directory path, or the
+    files listed in the manifest file path, one per line. Blank lines and
+    '#' comments are skipped, relative paths are relative to the manifest.
+    """
+    binaries = []
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            binaries.extend(os.path.join(root, x) for x in sorted(files))
+        return binaries
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                binaries.append(os.path.join(base, line))
+    return binaries
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+class _Binary(object):
+    """
+    Progress of one binary of a batch. The reader thread fills in the
+    extraction side, everything else happens in the main thread.
+    """
+
+    def __init__(self, fpath, outputdir):
+        self.fpath = fpath
+        self.outputdir = outputdir
+        self.started = time.time()
+        self.extract_seconds = None
+        self.extracted = False
+        self.error = None
+        self.entries = 0
+        self.known = 0
+        self.pending = 0
+        self.results = {}
+        self.deduplicated = 0
+
+    def report(self):
+        failures = dict((file, error) for file, error in self.results.items() if error is not None)
+        if self.error is not None:
+            status = "error"
+        elif failures:
+            status = "partial"
+        else:
+            status = "ok"
+        return {
+            "binary": self.fpath,
+            "outputdir": self.outputdir,
+            "status": status,
+            "error": self.error,
+            "entries": self.entries,
+            "modules": len(self.results),
+            "decompiled": len(self.results) - len(failures),
+            "failed": len(failures),
+            "deduplicated": self.deduplicated,
+            "known": self.known,
+            "failures": failures,
+            "timings": {
+                "extract": self.extract_seconds,
+                "total": time.time() - self.started,
+            },
+        }
+
+
+class Fleet(object):
+    """
+    Unfreeze a batch of binaries in one process over one shared decompile
+    pool.
+
+    A reader thread extracts the binaries one after the other while the
+    pool decompiles. A module byte-identical to one met earlier in the
+    batch is not decompiled again, the first output is copied. Every
+    binary gets a JSON report (REPORT_NAME) in its output directory.
+
+    extractor_cls  ArchiveExtractor subclass used for every binary, the
+                   remaining options are passed on to it.
+    """
+    QUEUE_DEPTH = 16
+
+    def __init__(self, extractor_cls, outputdir=None, multiproc=True, workers=None, timeout=None,
+                 max_memory=None, maxtasks=None, handle_fallback=default_handle_disassemble, **options):
+        self.extractor_cls = extractor_cls
+        self.outputdir = os.path.abspath(outputdir or os.curdir)
+        self.multiproc = multiproc
+        self.workers = workers or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.maxtasks = maxtasks
+        self.handle_fallback = handle_fallback
+        # one stream for the whole batch, shared by every extractor
+        self.events = options.get("events") or EventStream()
+        options["events"] = self.events
+        self.options = options
+
+    def _outputdirs(self, fpaths):
+        names = set()
+        for fpath in fpaths:
+            name = os.path.splitext(os.path.basename(fpath))[0] + "-unfreeze"
+            unique, n = name, 1
+            while unique in names:
+                n += 1
+                unique = "%s-%d" % (name, n)
+            names.add(unique)
+            yield fpath, os.path.join(self.outputdir, unique)
+
+    def _produce(self, fpaths, items):
+        for fpath, outputdir in self._outputdirs(fpaths):
+            binary = _Binary(fpath, outputdir)
+            items.put(("start", binary, None))
+            try:
+                extractor = self.extractor_cls(fpath, outputdir=outputdir, workers=self.workers, **self.options)
+                self.extractors.append(extractor)
+                for dst_fpath in extractor.iter_extract():
+                    binary.entries += 1
+                    if dst_fpath.endswith(".pyc"):
+                        items.put(("file", binary, (extractor, dst_fpath)))
+                binary.known = len(extractor.known)
+            except Exception as e:
+                binary.error = str(e)
+            binary.extract_seconds = time.time() - binary.started
+            items.put(("done", binary, None))
+        items.put(None)
+
+    def _record(self, binary, file, error):
+        binary.results[file] = error
+        binary.pending -= 1
+        self._finish(binary)
+
+    def _finish(self, binary):
+        if not binary.extracted or binary.pending:
+            return
+        report = binary.report()
+        self.reports.append(report)
+        # a binary that failed before anything was extracted has no output
+        # directory yet, its report is the one that matters most
+        if not os.path.isdir(binary.outputdir):
+            os.makedirs(binary.outputdir)
+        write_report(report, os.path.join(binary.outputdir, REPORT_NAME))
+        sys.stdout.write("[ batch ] %s : %s, %d modules, %d failed, %d deduplicated, %.1fs\n" % (
+            binary.fpath, report["status"], report["modules"], report["failed"], report["deduplicated"],
+            report["timings"]["total"]))
+
+    def _copy_result(self, primary, file, binary, extractor):
+        error = self.results[primary]
+        # the source, or the disassembly of a module that went over budget
+        for src_fpath, dst_fpath in ((primary[:-1], file[:-1]),
+                                     (os.path.splitext(primary)[0] + ".dis", os.path.splitext(file)[0] + ".dis")):
+            if os.path.isfile(src_fpath):
+                shutil.copyfile(src_fpath, dst_fpath)
+        if error is None and not extractor.pyc_persist:
+            os.remove(file)
+        binary.deduplicated += 1
+        self._record(binary, file, error)
+
+    def _decompiled(self, job, result, seconds):
+        file, error = result
+        self.events.add("decompile", seconds, name=file, error=error)
+
+    def _decompile(self, job):
+        started = clock()
+        result = _decompile_job(job)
+        self._decompiled(job, result, clock() - started)
+        return result
+
+    def _jobs(self, items):
+        while True:
+            try:
+                item = items.get(timeout=WorkerPool.POLL_INTERVAL)
+            except queue.Empty:
+                yield WorkerPool.WAIT
+                continue
+            if item is None:
+                return
+            kind, binary, value = item
+            if kind == "done":
+                binary.extracted = True
+                self._finish(binary)
+                continue
+            if kind != "file":
+                continue
+            extractor, file = value
+            binary.pending += 1
+            self.owners[file] = binary, extractor
+            with open(file, 'rb') as f:
+                key = content_key(f.read())
+            primary = self.primaries.get(key)
+            if primary is None:
+                self.primaries[key] = file
+                yield (extractor.handle_decompile, file, extractor.pyc_persist, extractor.cache)
+            elif primary in self.results:
+                self._copy_result(primary, file, binary, extractor)
+            else:
+                self.aliases.setdefault(primary, []).append(file)
+
+    def run(self, fpaths):
+        """
+        Unfreeze every binary in fpaths.
+
+        Returns the list of reports, in the order binaries finished.
+        """
+        self.reports = []
+        # content key -> first file with it, and the files waiting for it
+        self.primaries = {}
+        self.aliases = {}
+        self.results = {}
+        self.owners = {}
+        # every extractor opened, closed once the whole batch is done: a
+        # module met again later is copied from the output of the first
+        self.extractors = []
+
+        items = queue.Queue(self.workers * self.QUEUE_DEPTH)
+        producer = threading.Thread(target=self._produce, args=(fpaths, items))
+        producer.daemon = True
+        producer.start()
+
+        try:
+            jobs = self._jobs(items)
+            if not self.multiproc or self.workers == 1:
+                results = (self._decompile(job) for job in jobs if job is not WorkerPool.WAIT)
+            else:
+                pool = WorkerPool(_decompile_job, self.workers, timeout=self.timeout, max_memory=self.max_memory,
+                                  maxtasks=self.maxtasks,
+                                  on_budget=lambda job, reason: fallback_result(self.handle_fallback, job, reason,
+                                                                                self.events),
+                                  on_done=self._decompiled)
+                results = pool.imap_unordered(jobs)
+            for file, error in results:
+                self.results[file] = error
+                binary, _extractor = self.owners[file]
+                self._record(binary, file, error)
+                for alias in self.aliases.pop(file, ()):
+                    alias_binary, alias_extractor = self.owners[alias]
+                    self._copy_result(file, alias, alias_binary, alias_extractor)
+            producer.join()
+
+            for extractor in self.extractors:
+                if extractor.cache is not None:
+                    extractor.cache.prune()
+                    break
+        finally:
+            # finish zip and tar outputs, the decompiled modules still in
+            # their workdirs go in too
+            for extractor in self.extractors:
+                try:
+                    extractor.close()
+                except Exception as e:
+                    sys.stdout.write("[ batch ] %s : close failed: %s\n" % (extractor.fpath, e))
+        self.events.flush()
+        return self.reports
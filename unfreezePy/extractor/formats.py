@@ -0,0 +1,132 @@
+# encoding: utf-8
+
+import os
+import struct
+
+# Mach-O magics, thin 32/64-bit in either byte order and universal
+_MACHO_MAGICS = (b"\xfe\xed\xfa\xce", b"\xce\xfa\xed\xfe", b"\xfe\xed\xfa\xcf", b"\xcf\xfa\xed\xfe",
+                 b"\xca\xfe\xba\xbe")
+_ZIP_EOCD = struct.Struct("<4sHHHHIIH")
+_ZIP_ENTRY = struct.Struct("<4sHHHHHHIIIHHHHHII")
+
+
+class Probe(object):
+    """
+    What format sniffers get to see of a file: its first HEAD_SIZE and
+    last TAIL_SIZE bytes, read once. A zip at the end of the file costs
+    one more read, for its central directory, and only if asked for.
+
+    kind is "pe", "elf", "macho", "zip" or None, from the head.
+    """
+    HEAD_SIZE = 64 * 1024
+    # a PyInstaller cookie may sit behind a code signature
+    TAIL_SIZE = 64 * 1024
+    # central directories beyond this are not read
+    MAX_DIRECTORY = 64 << 20
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            self.head = f.read(self.HEAD_SIZE)
+            f.seek(max(0, self.size - self.TAIL_SIZE))
+            self.tail = f.read()
+        head = self.head
+        if head[:2] == b"MZ":
+            self.kind = "pe"
+        elif head[:4] == b"\x7fELF":
+            self.kind = "elf"
+        elif head[:4] in _MACHO_MAGICS:
+            self.kind = "macho"
+        elif head[:4] == b"PK\x03\x04":
+            self.kind = "zip"
+        else:
+            self.kind = None
+        self._zip_names = None
+
+    def find(self, marker):
+        """
+        True if marker is in the head or the tail.
+        """
+        return marker in self.head or marker in self.tail
+
+    def zip_names(self):
+        """
+        The names in the zip at the end of the file, a zip on its own or
+        one appended to an executable; () if there is none.
+        """
+        if self._zip_names is None:
+            self._zip_names = self._read_zip_names()
+        return self._zip_names
+
+    def _read_zip_names(self):
+        pos = self.tail.rfind(b"PK\x05\x06")
+        if pos < 0 or len(self.tail) - pos < _ZIP_EOCD.size:
+            return ()
+        fields = _ZIP_EOCD.unpack(self.tail[pos:pos + _ZIP_EOCD.size])
+        directory_size = fields[5]
+        # the directory sits right before the end record, wherever the zip
+        # starts in the file
+        start = self.size - len(self.tail) + pos - directory_size
+        if start < 0 or directory_size > self.MAX_DIRECTORY:
+            return ()
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            directory = f.read(directory_size)
+        names = []
+        offset = 0
+        while offset + _ZIP_ENTRY.size <= len(directory):
+            entry = _ZIP_ENTRY.unpack(directory[offset:offset + _ZIP_ENTRY.size])
+            if entry[0] != b"PK\x01\x02":
+                break
+            name_len, extra_len, comment_len = entry[10:13]
+            name = directory[offset + _ZIP_ENTRY.size:offset + _ZIP_ENTRY.size + name_len]
+            names.append(name.decode("utf-8", "replace"))
+            offset += _ZIP_ENTRY.size + name_len + extra_len + comment_len
+        return tuple(names)
+
+
+# (name, sniff, extractor_cls, scan) in the order they are tried
+FORMATS = []
+
+
+def register(name, sniff, extractor_cls=None, scan=None):
+    """
+    Add the format name: sniff(probe) -> bool recognises a Probe of it,
+    extractor_cls is its ArchiveExtractor, None while there is none.
+
+    scan(probe) -> bool is a costlier check that may read the whole
+    file, tried only once no sniffer recognised it.
+    """
+    FORMATS.append((name, sniff, extractor_cls, scan))
+
+
+def detect(fpath):
+    """
+    Find the format of fpath from its head and tail, or if that fails
+    from the scans of the formats that have one.
+
+    Returns (name, extractor_cls) of the first registered format that
+    recognises it, (None, None) if none does.
+    """
+    probe = Probe(fpath)
+    for name, sniff, extractor_cls, scan in FORMATS:
+        if sniff(probe):
+            return name, extractor_cls
+    for name, sniff, extractor_cls, scan in FORMATS:
+        if scan is not None and scan(probe):
+            return name, extractor_cls
+    return None, None
+
+
+from .app import cxFreeze, py2app, py2exe
+from .app import pyinstaller
+from .pyinstaller import PyinstallerExtractor
+from .zipbundle import CxFreezeExtractor, Py2appExtractor
+
+# the PyInstaller cookie is the surest sign, the zip based formats come after
+# the cookie may also hide behind an overlay larger than the tail
+register("pyinstaller", pyinstaller.sniff, PyinstallerExtractor, pyinstaller.scan)
+register("py2exe", py2exe.sniff)
+register("cxFreeze", cxFreeze.sniff, CxFreezeExtractor)
+register("py2app", py2app.sniff, Py2appExtractor)
@@ -0,0 +1,41 @@
+# encoding: utf-8
+
+
+def plan_layout(modules):
+    """
+    Where each module goes below the output root, from the TOC alone.
+
+    modules is an iterable of (name, ispkg), name dotted. A package, or a
+    module that other modules live below, becomes <name>/__init__.pyc,
+    any other module <name>.pyc.
+
+    Returns a dict name -> relative path, '/' separated.
+    """
+    modules = list(modules)
+    parents = set()
+    for name, ispkg in modules:
+        parts = name.split('.')
+        for i in range(1, len(parts)):
+            parents.add('.'.join(parts[:i]))
+    paths = {}
+    for name, ispkg in modules:
+        base = name.replace('.', '/')
+        paths[name] = base + '/__init__.pyc' if ispkg or name in parents else base + '.pyc'
+    return paths
+
+
+def missing_packages(paths):
+    """
+    The directories holding the relative module paths that have no
+    __init__ module of their own, each needs an empty __init__.py to be
+    importable.
+    """
+    dirs = set()
+    packages = set()
+    for path in paths:
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            dirs.add('/'.join(parts[:i]))
+        if parts[-1] in ('__init__.pyc', '__init__.py'):
+            packages.add('/'.join(parts[:-1]))
+    return sorted(dirs - packages)
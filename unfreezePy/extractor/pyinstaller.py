@@ -1,10 +1,12 @@
 # encoding: utf-8
 
 import os
+import sys
 import traceback
 
 from app.pyinstaller.readers import CArchiveReader
 from app.pyinstaller.readers import ZlibArchiveReader
+from events import EventStream
 from extractor import ArchiveExtractor
 
 
@@ -12,6 +14,28 @@ class PyinstallerExtractor(ArchiveExtractor):
 
     def __init__(self, fpath, **kwargs):
         key = kwargs.get("key","")
-        reader = ZlibArchiveReader(fpath,key) if fpath.lower().endswith(".pyz") \
-            else CArchiveReader(fpath,key)
-        super(PyinstallerExtractor, self).__init__(fpath, reader=reader, **kwargs)
+        use_mmap = kwargs.get("use_mmap", False)
+        threads = kwargs.get("threads") or 1
+        processes = kwargs.get("processes") or 1
+        compact_toc = kwargs.get("compact_toc", False)
+        # the readers and the extractor report to the same stream
+        events = kwargs.pop("events", None) or EventStream()
+        reader = ZlibArchiveReader(fpath, key=key, use_mmap=use_mmap, threads=threads, processes=processes,
+                                   events=events) \
+            if fpath.lower().endswith(".pyz") \
+            else CArchiveReader(fpath, key=key, use_mmap=use_mmap, threads=threads, processes=processes,
+                                compact_toc=compact_toc, events=events)
+        super(PyinstallerExtractor, self).__init__(fpath, reader=reader, events=events, **kwargs)
+
+    @staticmethod
+    def scan(fpath):
+        """
+        Print every PyInstaller archive found in fpath, the last one first.
+
+        Returns the number of archives found.
+        """
+        archives = CArchiveReader.find_archives(fpath)
+        for pkg_start, length, pyvers, pylib_name in archives:
+            sys.stdout.write("[ archive ] offset %d, length %d, python %s, %s\n" % (pkg_start, length, pyvers,
+                                                                                 pylib_name))
+        return len(archives)
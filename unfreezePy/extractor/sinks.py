@@ -0,0 +1,282 @@
+# encoding: utf-8
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+
+
+class OutputSink(object):
+    """
+    Where an extractor puts the entries of an archive and the decompiled
+    sources, by path relative to the output root.
+
+    The decompiler works on files, so the .pyc files to decompile are
+    staged below workdir, a temporary directory, and their outputs moved
+    into the sink by commit() once decompiled. close() moves whatever is
+    left there and finishes the output.
+
+    Writes may come from several threads.
+    """
+
+    def __init__(self):
+        self._workdir = None
+        self._lock = threading.Lock()
+
+    @property
+    def workdir(self):
+        if self._workdir is None:
+            self._workdir = tempfile.mkdtemp(prefix="unfreeze-")
+        return self._workdir
+
+    def write(self, path, data):
+        """
+        Store data under path.
+        """
+        with self._lock:
+            self._write(path, data)
+
+    def _write(self, path, data):
+        raise NotImplementedError
+
+    def write_chunks(self, path, chunks):
+        """
+        Store the data given as an iterable of chunks under path, for
+        entries too big to be held in memory. Sinks that can, write it
+        as it comes.
+        """
+        with self._lock:
+            self._write_chunks(path, chunks)
+
+    def _write_chunks(self, path, chunks):
+        # stored chunks may be views into a mapping
+        self._write(path, b"".join(bytes(chunk) for chunk in chunks))
+
+    def stage(self, path, data):
+        """
+        Write data to a file below workdir, for the decompiler to work on.
+
+        Returns the path of that file.
+        """
+        dst_fpath = os.path.join(self.workdir, path)
+        directory = os.path.dirname(dst_fpath)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(dst_fpath, 'wb') as f:
+            f.write(data)
+        return dst_fpath
+
+    def commit(self, file):
+        """
+        Move the file below workdir into the sink.
+
+        Returns the name it is stored under.
+        """
+        path = os.path.relpath(file, self.workdir)
+        if os.path.isfile(file):
+            with open(file, 'rb') as f:
+                self.write(path, f.read())
+            os.remove(file)
+        return path
+
+    def close(self):
+        if self._workdir is None:
+            return
+        for root, dirs, files in os.walk(self._workdir):
+            dirs.sort()
+            for name in sorted(files):
+                self.commit(os.path.join(root, name))
+        shutil.rmtree(self._workdir, ignore_errors=True)
+        self._workdir = None
+
+
+class DirectorySink(OutputSink):
+    """
+    Files below the directory root. Files are decompiled in place, so
+    there is nothing to commit.
+    """
+
+    def __init__(self, root):
+        super(DirectorySink, self).__init__()
+        self.root = os.path.abspath(root)
+        # directories known to exist, saves a stat per entry
+        self._dirs = set()
+
+    @property
+    def workdir(self):
+        return self.root
+
+    def _makedirs(self, directory):
+        if directory in self._dirs:
+            return
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # another thread won the race
+                if not os.path.isdir(directory):
+                    raise
+        self._dirs.add(directory)
+
+    def _write(self, path, data):
+        self.stage(path, data)
+
+    def stage(self, path, data):
+        dst_fpath = os.path.join(self.root, path)
+        self._makedirs(os.path.dirname(dst_fpath))
+        with open(dst_fpath, 'wb') as f:
+            f.write(data)
+        return dst_fpath
+
+    def _write_chunks(self, path, chunks):
+        dst_fpath = os.path.join(self.root, path)
+        self._makedirs(os.path.dirname(dst_fpath))
+        with open(dst_fpath, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    def commit(self, file):
+        return file
+
+    def close(self):
+        pass
+
+
+class _FileSink(OutputSink):
+    """
+    A sink writing a single archive file through a large buffer, so that
+    the many small entries go out in bulk writes. The file is only
+    created by the first write.
+    """
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path):
+        super(_FileSink, self).__init__()
+        self.path = os.path.abspath(path)
+        self.file = None
+
+    def _ensure_open(self):
+        if self.file is None:
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.file = io.open(self.path, 'wb', buffering=self.BUFFER_SIZE)
+            self._open()
+
+    def write(self, path, data):
+        with self._lock:
+            self._ensure_open()
+            self._write(path, data)
+
+    def write_chunks(self, path, chunks):
+        # the archive formats want the size or the whole data up front:
+        # the chunks go to a file below workdir first, which is copied
+        # in pieces
+        fd, spool = tempfile.mkstemp(dir=self.workdir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.chmod(spool, 0o644)
+            with self._lock:
+                self._ensure_open()
+                self._write_file(path, spool)
+        finally:
+            os.remove(spool)
+
+    def close(self):
+        super(_FileSink, self).close()
+        if self.file is not None:
+            self._close()
+            self.file.close()
+            self.file = None
+
+
+class ZipSink(_FileSink):
+    """
+    A zip file, entries deflated unless compression says otherwise.
+    """
+
+    def __init__(self, path, compression=zipfile.ZIP_DEFLATED):
+        super(ZipSink, self).__init__(path)
+        self.compression = compression
+
+    def _open(self):
+        self.zip = zipfile.ZipFile(self.file, 'w', self.compression, allowZip64=True)
+
+    def _write(self, path, data):
+        info = zipfile.ZipInfo(path.replace(os.sep, '/'), time.localtime()[:6])
+        info.compress_type = self.compression
+        info.external_attr = 0o644 << 16
+        self.zip.writestr(info, data)
+
+    def _write_file(self, path, fpath):
+        self.zip.write(fpath, path.replace(os.sep, '/'), self.compression)
+
+    def _close(self):
+        self.zip.close()
+
+
+class TarSink(_FileSink):
+    """
+    A tar file written as a stream, compression is "" or "gz", "bz2".
+    """
+
+    def __init__(self, path, compression=""):
+        super(TarSink, self).__init__(path)
+        self.compression = compression
+        self.mtime = time.time()
+
+    def _open(self):
+        self.tar = tarfile.open(fileobj=self.file, mode="w|" + self.compression)
+
+    def _write(self, path, data):
+        info = tarfile.TarInfo(path.replace(os.sep, '/'))
+        info.size = len(data)
+        info.mtime = self.mtime
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def _write_file(self, path, fpath):
+        info = tarfile.TarInfo(path.replace(os.sep, '/'))
+        info.size = os.path.getsize(fpath)
+        info.mtime = self.mtime
+        with open(fpath, 'rb') as f:
+            self.tar.addfile(info, f)
+
+    def _close(self):
+        self.tar.close()
+
+
+class MemorySink(OutputSink):
+    """
+    Keeps everything in the dict files, path -> bytes, for library
+    callers.
+    """
+
+    def __init__(self):
+        super(MemorySink, self).__init__()
+        self.files = {}
+
+    def _write(self, path, data):
+        self.files[path.replace(os.sep, '/')] = bytes(data)
+
+
+def make_sink(path):
+    """
+    The sink for the output path: a zip or tar file by its extension,
+    else a directory.
+    """
+    lower = path.lower()
+    if lower.endswith(".zip"):
+        return ZipSink(path)
+    if lower.endswith((".tar.gz", ".tgz")):
+        return TarSink(path, "gz")
+    if lower.endswith((".tar.bz2", ".tbz2")):
+        return TarSink(path, "bz2")
+    if lower.endswith(".tar"):
+        return TarSink(path)
+    return DirectorySink(path)
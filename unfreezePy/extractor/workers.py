@@ -0,0 +1,269 @@
+# encoding: utf-8
+
+import collections
+import heapq
+import multiprocessing
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    # Python 3
+    import queue
+
+try:
+    import resource
+except ImportError:
+    # Windows: no per-process memory limit
+    resource = None
+
+
+def _limit_memory(max_memory):
+    """
+    Cap the address space of the current process to max_memory MB,
+    allocations beyond that raise MemoryError.
+    """
+    if resource is None or not max_memory:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = int(max_memory * 1024 * 1024)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _worker_loop(conn, func, max_memory):
+    _limit_memory(max_memory)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        try:
+            result = func(job)
+        except MemoryError:
+            # the heap is in an unknown state now, report and let the
+            # pool replace this process
+            conn.send(("memory", None))
+            break
+        conn.send(("done", result))
+    conn.close()
+
+
+class _Worker(object):
+
+    def __init__(self, func, max_memory):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_loop, args=(child_conn, func, max_memory))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.job = None
+        self.started = None
+        self.tasks = 0
+
+    def submit(self, job):
+        self.job = job
+        self.started = time.time()
+        self.tasks += 1
+        self.conn.send(job)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join()
+        self.conn.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+
+def largest_first(jobs, cost):
+    """
+    The jobs sorted by their estimated cost(job), the costliest first.
+
+    Decompile times are skewed, a few big modules dominate: started last,
+    one of them keeps a single worker busy while the others idle.
+    """
+    return sorted(jobs, key=cost, reverse=True)
+
+
+def queued_largest_first(source, cost, sentinel=None):
+    """
+    Yield the jobs put in the queue source until sentinel, the costliest
+    one queued so far first. Everything queued is taken in at once, the
+    producer is never held up. WorkerPool.WAIT is yielded while there is
+    nothing to hand out yet.
+    """
+    ready = []
+    done = False
+    count = 0
+    while True:
+        while not done:
+            try:
+                job = source.get_nowait()
+            except queue.Empty:
+                break
+            if job is sentinel:
+                done = True
+            else:
+                # count keeps equal costs in queue order, jobs never get compared
+                heapq.heappush(ready, (-cost(job), count, job))
+                count += 1
+        if ready:
+            yield heapq.heappop(ready)[2]
+            continue
+        if done:
+            return
+        try:
+            job = source.get(timeout=WorkerPool.POLL_INTERVAL)
+        except queue.Empty:
+            yield WorkerPool.WAIT
+            continue
+        if job is sentinel:
+            done = True
+        else:
+            heapq.heappush(ready, (-cost(job), count, job))
+            count += 1
+
+
+class Retry(object):
+    """
+    What on_budget returns for a job to be run again instead of a result:
+    job, usually a cheaper variant of the one that went over budget, goes
+    to a worker ahead of the jobs not started yet, under the same budget.
+    """
+
+    def __init__(self, job):
+        self.job = job
+
+
+class WorkerPool(object):
+    """
+    A process pool that dispatches one job at a time to each worker and
+    enforces a budget per job.
+
+    func         picklable callable run in the workers, func(job) -> result.
+    workers      number of worker processes.
+    timeout      wall-clock seconds a single job may take.
+    max_memory   address space limit of a worker in MB (not on Windows).
+    maxtasks     recycle a worker after this many jobs.
+    on_budget    on_budget(job, reason) -> result, called in the parent for a
+                 job whose worker was killed or died; the worker is replaced.
+                 A Retry instead of a result runs its job in a worker.
+    on_done      on_done(job, result, seconds) is called in the parent for
+                 every finished job, seconds being its wall-clock time.
+
+    Each worker talks to the parent over its own pipe, so killing one of
+    them can not corrupt the results of the others.
+    """
+    POLL_INTERVAL = 0.01
+    # yielded by a job iterator that has no job ready yet, e.g. one fed by
+    # a producer thread; the pool keeps supervising and asks again later
+    WAIT = object()
+
+    def __init__(self, func, workers, timeout=None, max_memory=None, maxtasks=None, on_budget=None, on_done=None):
+        self.func = func
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.maxtasks = maxtasks
+        self.on_budget = on_budget or (lambda job, reason: (job, reason))
+        self.on_done = on_done
+
+    def _spawn(self):
+        return _Worker(self.func, self.max_memory)
+
+    def _poll(self, worker):
+        """
+        Return (status, result) for a busy worker, or None if it is still
+        within budget and working.
+        """
+        if worker.conn.poll():
+            try:
+                return worker.conn.recv()
+            except EOFError:
+                return "died", None
+        if not worker.process.is_alive():
+            return "died", None
+        if self.timeout and time.time() - worker.started > self.timeout:
+            return "timeout", None
+        return None
+
+    def imap_unordered(self, jobs):
+        """
+        Yield the results of func over jobs in completion order. jobs may
+        be any iterable, it is consumed lazily as workers become idle.
+        """
+        jobs = iter(jobs)
+        idle, busy = [], []
+        retries = collections.deque()
+        pending = True
+        try:
+            while True:
+                while (retries or pending) and (idle or len(busy) < self.workers):
+                    if retries:
+                        job = retries.popleft()
+                    else:
+                        try:
+                            job = next(jobs)
+                        except StopIteration:
+                            pending = False
+                            continue
+                        if job is self.WAIT:
+                            break
+                    worker = idle.pop() if idle else self._spawn()
+                    worker.submit(job)
+                    busy.append(worker)
+                if not busy and not pending and not retries:
+                    break
+
+                finished = []
+                for worker in list(busy):
+                    polled = self._poll(worker)
+                    if polled is None:
+                        continue
+                    status, result = polled
+                    busy.remove(worker)
+                    job, worker.job = worker.job, None
+                    seconds = time.time() - worker.started
+                    if status == "done":
+                        if self.maxtasks and worker.tasks >= self.maxtasks:
+                            worker.stop()
+                        else:
+                            idle.append(worker)
+                        if self.on_done is not None:
+                            self.on_done(job, result, seconds)
+                        finished.append(result)
+                        continue
+                    exitcode = worker.process.exitcode
+                    worker.kill()
+                    if status == "timeout":
+                        reason = "timeout after %ss" % self.timeout
+                    elif status == "memory":
+                        reason = "memory budget of %sMB exceeded" % self.max_memory
+                    else:
+                        reason = "worker died (exit code %s)" % exitcode
+                    result = self.on_budget(job, reason)
+                    if isinstance(result, Retry):
+                        retries.append(result.job)
+                        continue
+                    if self.on_done is not None:
+                        self.on_done(job, result, seconds)
+                    finished.append(result)
+
+                if not finished:
+                    time.sleep(self.POLL_INTERVAL)
+                for result in finished:
+                    yield result
+        finally:
+            for worker in idle:
+                worker.stop()
+            for worker in busy:
+                worker.kill()
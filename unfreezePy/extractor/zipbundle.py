@@ -0,0 +1,29 @@
+# encoding: utf-8
+
+from .app.cxFreeze.readers import CxFreezeReader
+from .app.py2app.readers import Py2appReader
+from .events import EventStream
+from .extractor import ArchiveExtractor
+
+
+class ZipBundleExtractor(ArchiveExtractor):
+    """
+    Extractor of the zip based bundles, reader_cls opens the library zip
+    of a binary.
+    """
+    reader_cls = None
+
+    def __init__(self, fpath, **kwargs):
+        threads = kwargs.get("threads") or 1
+        # the reader and the extractor report to the same stream
+        events = kwargs.pop("events", None) or EventStream()
+        reader = self.reader_cls.open(fpath, threads=threads, events=events)
+        super(ZipBundleExtractor, self).__init__(fpath, reader=reader, events=events, **kwargs)
+
+
+class CxFreezeExtractor(ZipBundleExtractor):
+    reader_cls = CxFreezeReader
+
+
+class Py2appExtractor(ZipBundleExtractor):
+    reader_cls = Py2appReader
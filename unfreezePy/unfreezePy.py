@@ -5,16 +5,63 @@ import argparse
 import sys
 
 from extractor.pyinstaller import PyinstallerExtractor
+from extractor.events import EventStream, MODES
+from extractor.fleet import Fleet, list_binaries
+from extractor.diff import diff_binaries
+from extractor.formats import detect
 
 
 def get_argparse():
     parser = argparse.ArgumentParser()
     parser.add_argument('-s', '--single-process', default=True, action="store_false",
                         dest='multiproc', help='single process')
+    parser.add_argument('-j', '--jobs', default=None, type=int,
+                        dest='workers', help='number of decompile worker processes (default: cpu count)')
+    parser.add_argument('-t', '--timeout', default=None, type=float,
+                        dest='timeout', help='seconds a module may take to decompile before it is disassembled instead')
+    parser.add_argument('--max-memory', default=None, type=int,
+                        dest='max_memory', help='memory budget of a decompile worker in MB')
+    parser.add_argument('--max-tasks', default=None, type=int,
+                        dest='maxtasks', help='recycle a decompile worker after this many modules')
+    parser.add_argument('--cache-dir', default=None, action='store',
+                        dest='cache_dir', help='reuse decompiled sources of identical modules from this directory')
+    parser.add_argument('--cache-size', default=None, type=int,
+                        dest='cache_size', help='size bound of the decompile cache in MB')
+    parser.add_argument('--fingerprints', default=None, action='store',
+                        dest='fingerprints', help='fingerprint index of known stdlib/third-party modules to skip')
+    parser.add_argument('--label-known', default="skip", action='store_const', const="label",
+                        dest='known_modules', help='decompile known modules too, only label them')
     parser.add_argument('-c', '--clean-pyc', default=True, action="store_false",
                         dest='pyc_persist', help='Keep the .pyc file')
+    parser.add_argument('-k', '--key', default="", action='store',
+                        dest='key', help='key of an encrypted PYZ (default: read from the archive)')
+    parser.add_argument('-m', '--mmap', default=False, action="store_true",
+                        dest='use_mmap', help='read the archive through mmap')
+    parser.add_argument('-z', '--inflate-threads', default=1, type=int,
+                        dest='threads', help='number of threads decompressing archive entries')
+    parser.add_argument('-d', '--decrypt-workers', default=1, type=int,
+                        dest='processes', help='number of processes decrypting and decompressing encrypted PYZ entries')
+    parser.add_argument('--no-pipeline', default=True, action="store_false",
+                        dest='pipeline', help='extract everything before decompiling')
+    parser.add_argument('-l', '--list', default=False, action="store_true",
+                        dest='list', help='list the archive content, extract nothing')
+    parser.add_argument('--scan', default=False, action="store_true",
+                        dest='scan', help='report every PyInstaller archive in the file, extract nothing')
+    parser.add_argument('--only', default=None, action='append', metavar='PATTERN',
+                        dest='only', help='only extract entries whose name matches this glob, may be repeated')
+    parser.add_argument('--types', default=None, action='store', metavar='CODES',
+                        dest='types', help='only extract entries of these type codes, e.g. mMsz')
+    parser.add_argument('-b', '--batch', default=False, action="store_true",
+                        dest='batch', help='pyi_archive is a directory or a manifest file of binaries to unfreeze')
+    parser.add_argument('--diff', default=None, action='store', metavar='OLD',
+                        dest='diff', help='compare with the build OLD and only decompile the changed modules')
+    parser.add_argument('-p', '--progress', default=None, choices=MODES,
+                        dest='progress', help='progress output: quiet (default), a summary of the stage timers, '
+                                              'or every event as JSON lines')
+    parser.add_argument('--events', default=None, action='store', metavar='FILE',
+                        dest='events_file', help='write the progress events as JSON lines to FILE')
     parser.add_argument('-o', '--outputdir', action='store',
-                        dest='outputdir', help='output directory')
+                        dest='outputdir', help='output directory, or a .zip, .tar, .tar.gz or .tar.bz2 file')
     parser.add_argument('fpath', metavar='pyi_archive',
                         help="binary archive to extract content of")
     args = parser.parse_args()
@@ -24,33 +71,73 @@ def get_argparse():
 def run():
     args = get_argparse()
     print (args)
-    extrators = dict([
-        ("pyinstaller", PyinstallerExtractor)
-    ])
-    success = False
-    for product in extrators:
-        extrator_cls = extrators[product]
-        try:
-            extrator = extrator_cls(**vars(args))
-        except Exception as e:
-            sys.stdout.write("[input error] : %s \n" % e.message)
-            raise SystemError
+    if args.scan:
+        if not PyinstallerExtractor.scan(args.fpath):
+            sys.stdout.write("no PyInstaller archive found\n")
+        return
+    stream = open(args.events_file, 'w') if args.events_file else None
+    events = args.events = EventStream(args.progress or ("events" if stream else "quiet"), stream)
+    try:
+        unfreeze(args)
+    finally:
+        events.close()
+        if stream is not None:
+            stream.close()
+
+
+def unfreeze(args):
+    if args.batch:
+        options = vars(args)
+        fpath = options.pop('fpath')
+        reports = Fleet(PyinstallerExtractor, **options).run(list_binaries(fpath))
+        failed = [x for x in reports if x["status"] != "ok"]
+        sys.stdout.write("[ batch summary ] %d binaries, %d with errors\n" % (len(reports), len(failed)))
+        return
+    if args.diff:
+        options = vars(args)
+        diff_binaries(PyinstallerExtractor, options.pop('diff'), options.pop('fpath'), **options)
+        return
+    try:
+        product, extrator_cls = detect(args.fpath)
+    except (IOError, OSError) as e:
+        sys.stdout.write("[input error] : %s \n" % e)
+        raise SystemError
+    if product is None:
+        sys.stdout.write("no supported format detected\n")
+        return
+    if extrator_cls is None:
+        sys.stdout.write("[ %s ] detected, not supported yet\n" % product)
+        return
+    try:
+        extrator = extrator_cls(**vars(args))
+    except Exception as e:
+        sys.stdout.write("[input error] : %s \n" % e.message)
+        raise SystemError
+
+    # close() commits the output and cleans the workdir, whichever way
+    # this ends
+    try:
+        if args.list:
+            extrator.list_toc()
+            return
 
         try:
-            extrator.extract()
+            if args.pipeline:
+                # decompile while extracting
+                extrator.unfreeze()
+            else:
+                extrator.extract()
         except Exception as e:
-            sys.stdout.write("[trying uncompyle failed] : [ %s ] [ %s ] \n" % (product,e.message))
-            continue
-        else:
-            success = True
-            sys.stdout.write("[uncompyle success] : [ %s ]\n" % product)
+            sys.stdout.write("[uncompyle failed] : [ %s ] [ %s ] \n" % (product,e.message))
+            return
+        sys.stdout.write("[uncompyle success] : [ %s ]\n" % product)
+        if not args.pipeline:
             try:
                 extrator.uncompyle()
             except Exception as e:
                 sys.stdout.write("[uncompyle error] : %s\n" % e.message)
-            break
-    if not success:
-        sys.stdout.write("uncompyle failed after all testing\n")
+    finally:
+        extrator.close()
 
 
 if __name__ == '__main__':
@@ -1,10 +1,12 @@
 from __future__ import print_function
 
 import argparse
+import codecs
+import io
 import os
 import sys
-import pprint
 import tempfile
+import time
 import zlib
 
 import imp
@@ -14,71 +16,345 @@ import xdis
 import xdis.unmarshal
 import shutil
 import multiprocessing
+import uncompyle6
+import uncompyle6.main
 
 from PyInstaller.loader import pyimod02_archive
 from PyInstaller.archive.readers import CArchiveReader, NotAnArchiveError
 import PyInstaller.log
 
+from unfreezePy.extractor.cache import open_cache
+from unfreezePy.extractor.events import EventStream, MODES, clock
+from unfreezePy.extractor.fingerprint import FingerprintIndex
+from unfreezePy.extractor.fleet import list_binaries, write_report, REPORT_NAME
+from unfreezePy.extractor.layout import missing_packages, plan_layout
+from unfreezePy.extractor.workers import WorkerPool, largest_first
 
-def main(name, pyver='35', outputdir=None, multiproc=False, pyc_persist=True, **unused_options):
+
+def main(name, **options):
+    summary = unfreeze(name, **options)
+    if summary is None:
+        return 1
+    return 1 if any(error is not None for error in summary.values()) else 0
+
+
+def unarchive(name, pyver='35', outputdir=None, pyc_persist=True, fingerprints=None, events=None):
+    """
+    Unarchive the binary name for decompiling.
+
+    Returns (outputdir, srcdir, modules): the .pyc files are below srcdir,
+    or without pyc_persist held in the dict modules. None if name is not
+    a file.
+    """
     if not os.path.isfile(name):
         print(name, "is an invalid file name!")
-        return 1
+        return None
 
+    if events is None:
+        events = EventStream()
+    started = clock()
     arch = get_archive(name)
-    show(name, arch)
+    events.add("toc", clock() - started, name=name)
+    show(name, arch, events)
     if not outputdir:
         outputdir = name.split('.', 1)[0] + '-pyi'
     tmp_outputdir = outputdir + '-tmp'
-    # unarchive
-    unarchive_pyi(arch, tmp_outputdir, pyver)
-    normalize_package_import(tmp_outputdir)
+    index = FingerprintIndex.load(fingerprints) if fingerprints else None
+    # without pyc_persist the modules stay in memory, no .pyc is ever written
+    modules = None if pyc_persist else {}
+    unarchive_pyi(arch, tmp_outputdir, pyver, index=index, events=events, modules=modules)
+    return outputdir, tmp_outputdir, modules
+
+
+def unfreeze(name, pyver='35', outputdir=None, multiproc=False, pyc_persist=True, cache_dir=None, cache_size=None,
+             fingerprints=None, timeout=None, cache=None, events=None, **unused_options):
+    """
+    Unarchive and decompile the binary name.
+
+    Returns a dict mapping every decompiled module to its error (None on
+    success), None if name is not a file.
+    """
+    unarchived = unarchive(name, pyver, outputdir, pyc_persist, fingerprints, events)
+    if unarchived is None:
+        return None
+    outputdir, tmp_outputdir, modules = unarchived
 
     # uncompyle
-    uncompyle_dir(tmp_outputdir, outputdir, pyc_persist, multiproc)
-
-
-def normalize_package_import(outputdir):
-    for root, dirs, files in os.walk(outputdir):
-        for x in files:
-            basename = os.path.splitext(os.path.basename(x))[0]
-            file = os.path.join(root, x)
-            pkg_path = os.path.join(root, basename)
-            if basename in dirs:
-                shutil.move(file, os.path.join(pkg_path, '__init__.pyc'))
-    for root, dirs, files in os.walk(outputdir):
-        for dir in dirs:
-            dir = os.path.join(root, dir)
-            pkg_file1 = os.path.join(dir, '__init__.pyc')
-            pkg_file2 = os.path.join(dir, '__init__.py')
-            if os.path.exists(pkg_file1) or os.path.exists(pkg_file2):
-                continue
-            open(pkg_file2, 'w').write('')
-    print('Normalize_package_import: ok! ')
-
-
-def uncompyle_dir(srcdir, outputdir, pyc_persist, multiproc):
+    if cache is None and cache_dir:
+        cache = open_cache(cache_dir, cache_size)
+    return uncompyle_dir(tmp_outputdir, outputdir, pyc_persist, multiproc, cache=cache, events=events,
+                         modules=modules, magic_int=magics.magic2int(imp.get_magic()), timeout=timeout)
+
+
+def batch_job(job):
+    # uncompyle_job() of one module of the binary number index of a batch
+    index, job = job
+    return index, uncompyle_job(job)
+
+
+class _BatchBinary(object):
+    # progress of one binary of main_batch()
+
+    def __init__(self, name, outputdir):
+        self.name = name
+        self.outputdir = outputdir
+        self.srcdir = None
+        self.started = time.time()
+        self.summary = {}
+        self.error = None
+        self.pending = 0
+        self.unarchived = False
+
+    def report(self):
+        failures = dict((x, self.summary[x]) for x in self.summary if self.summary[x] is not None)
+        if self.error is not None:
+            status = 'error'
+        else:
+            status = 'partial' if failures else 'ok'
+        return {
+            'binary': self.name,
+            'outputdir': self.outputdir,
+            'status': status,
+            'error': self.error,
+            'modules': len(self.summary),
+            'decompiled': len(self.summary) - len(failures),
+            'failed': len(failures),
+            'failures': failures,
+            'timings': {'total': time.time() - self.started},
+        }
+
+
+def main_batch(batch, outputdir=None, cache_dir=None, cache_size=None, pyver='35', multiproc=False,
+               pyc_persist=True, fingerprints=None, timeout=None, events=None, **unused_options):
+    """
+    Unfreeze every binary of the directory or manifest file batch in this
+    interpreter. The modules of all binaries go to one shared pool of
+    workers: a binary is unarchived while those of the previous ones are
+    decompiled. The binaries share one decompile cache (a temporary one
+    without --cache-dir), so a module found in several of them is
+    decompiled once. Each binary gets a JSON report next to its output.
+    """
+    if events is None:
+        events = EventStream()
+    tmp_cachedir = None
+    if not cache_dir:
+        tmp_cachedir = cache_dir = tempfile.mkdtemp(prefix='unpyinstaller-cache-')
+    cache = open_cache(cache_dir, cache_size)
+    magic_int = magics.magic2int(imp.get_magic())
+    binaries = []
+    reports = []
+
+    def finish(binary):
+        if not binary.unarchived or binary.pending:
+            return
+        if binary.srcdir is not None:
+            report_decompiled(binary.summary, binary.srcdir, pyc_persist, events)
+        report = binary.report()
+        reports.append(report)
+        # a binary that failed before anything was extracted has no output
+        # directory yet, its report is the one that matters most
+        if not os.path.isdir(binary.outputdir):
+            os.makedirs(binary.outputdir)
+        write_report(report, os.path.join(binary.outputdir, REPORT_NAME))
+        print('[ batch ]', binary.name, ':', report['status'], '%.1fs' % report['timings']['total'])
+
+    def jobs():
+        # unarchived one binary at a time, as the pool asks for more jobs
+        for name in list_binaries(batch):
+            binary = _BatchBinary(name, os.path.join(outputdir or os.curdir,
+                                                     os.path.basename(name).split('.', 1)[0] + '-pyi'))
+            binaries.append(binary)
+            binary_jobs = []
+            try:
+                unarchived = unarchive(name, pyver, binary.outputdir, pyc_persist, fingerprints, events)
+                if unarchived is None:
+                    binary.error = "invalid file name"
+                else:
+                    binary.outputdir, binary.srcdir, modules = unarchived
+                    binary_jobs = decompile_jobs(binary.srcdir, binary.outputdir, cache, modules, magic_int)
+            except Exception as e:
+                binary.error = str(e)
+            binary.pending = len(binary_jobs)
+            binary.unarchived = True
+            finish(binary)
+            for job in binary_jobs:
+                yield len(binaries) - 1, job
+
+    def decompiled(job, result, seconds):
+        index, (rel_fpath, error) = result
+        events.add("decompile", seconds, name=rel_fpath, error=error)
+
+    try:
+        if multiproc:
+            pool = WorkerPool(batch_job, multiprocessing.cpu_count(), timeout=timeout,
+                              on_budget=lambda job, reason: (job[0], (job[1][0], reason)), on_done=decompiled)
+            results = pool.imap_unordered(jobs())
+        else:
+            results = (batch_job(job) for job in jobs())
+        for index, (rel_fpath, error) in results:
+            binary = binaries[index]
+            binary.summary[rel_fpath] = error
+            binary.pending -= 1
+            finish(binary)
+        if cache is not None:
+            cache.prune()
+    finally:
+        if tmp_cachedir:
+            shutil.rmtree(tmp_cachedir, ignore_errors=True)
+    return 1 if any(report['status'] != 'ok' for report in reports) else 0
+
+
+def pyc_bytes(code, magic_int):
+    """
+    .pyc bytes of the marshalled code, as far as DecompileCache keys go:
+    the magic and a zeroed header.
+    """
+    return magics.int2magic(magic_int) + b'\0' * 12 + code
+
+
+def decompile_code(co, magic_int, out):
+    # uncompyle() became decompile() in uncompyle6 3, which also moved from
+    # float to tuple versions later on
+    decompile = getattr(uncompyle6.main, 'decompile', None) or uncompyle6.main.uncompyle
+    version = getattr(magics, 'magic_int2tuple', None) or magics.magic_int2float
+    # by keyword: 3.9 swapped the version and the code object around
+    decompile(bytecode_version=version(magic_int), co=co, out=out)
+
+
+def uncompyle_job(job):
+    """
+    Decompile one module of uncompyle_dir(), in a pool worker.
+
+    job is (rel_fpath, src, magic_int, dst_fpath, cache): src is the path
+    of a .pyc, or with a magic_int the marshalled code of the module
+    itself. Returns (rel_fpath, error), error is None on success.
+    """
+    rel_fpath, src, magic_int, dst_fpath, cache = job
+    key = None
+    if cache is not None:
+        key = cache.key(pyc_bytes(src, magic_int)) if magic_int is not None else cache.key_for(src)
+        if cache.fetch(key, dst_fpath):
+            return rel_fpath, None
+    try:
+        with codecs.open(dst_fpath, 'wb', encoding="utf-8") as f:
+            if magic_int is not None:
+                decompile_code(xdis.unmarshal.load_code(io.BytesIO(src), magic_int), magic_int, f)
+            else:
+                uncompyle6.decompile_file(src, f)
+    except MemoryError:
+        # the worker pool replaces the process
+        raise
+    except Exception as e:
+        # no empty or truncated source next to the good ones
+        if os.path.exists(dst_fpath):
+            os.remove(dst_fpath)
+        return rel_fpath, str(e)
+    if key is not None:
+        cache.store(key, dst_fpath)
+    return rel_fpath, None
+
+
+def job_cost(job):
+    # estimated decompile cost of an uncompyle_job(): the size of the module
+    rel_fpath, src, magic_int, dst_fpath, cache = job
+    return len(src) if magic_int is not None else os.path.getsize(src)
+
+
+def decompile_jobs(srcdir, outputdir, cache=None, modules=None, magic_int=None):
+    """
+    The uncompyle_job() jobs decompiling the .pyc files below srcdir, or
+    the in-memory modules (see unarchive_pyi()) compiled for magic_int,
+    into outputdir, the biggest modules first. The directories they write
+    to are created.
+    """
     if outputdir and not os.path.exists(outputdir):
         os.makedirs(outputdir)
-    num_core = multiprocessing.cpu_count() if multiproc else 1
-    exe = os.path.join(os.path.split(sys.executable)[0], 'Scripts\\uncompyle6.exe')
-    if not os.path.exists(exe):
-        exe = 'uncompyle6.exe'
-    cmd = [exe, '-r', '-p', str(num_core), '-o', outputdir, srcdir]
-    cmd = " ".join(cmd)
-    print(cmd)
-    rc = os.system(cmd)
-    if not rc and not pyc_persist:
+    jobs = []
+    if modules is not None:
+        for rel_fpath in sorted(modules):
+            jobs.append((rel_fpath, modules[rel_fpath], magic_int, os.path.join(outputdir, rel_fpath[:-1]), cache))
+    else:
+        for root, dirs, files in os.walk(srcdir):
+            for x in files:
+                if x.endswith('.pyc'):
+                    src_fpath = os.path.join(root, x)
+                    rel_fpath = os.path.relpath(src_fpath, srcdir)
+                    jobs.append((rel_fpath, src_fpath, None, os.path.join(outputdir, rel_fpath[:-1]), cache))
+    # the biggest modules first, so that none is left running alone at the end
+    jobs = largest_first(jobs, job_cost)
+    for job in jobs:
+        directory, _ = os.path.split(job[3])
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+    return jobs
+
+
+def report_decompiled(summary, srcdir, pyc_persist, events):
+    """
+    Print the decompile summary of one binary, and drop its .pyc files
+    unless pyc_persist or some module failed.
+    """
+    failed = sorted(x for x in summary if summary[x] is not None)
+    print('Decompile: %d ok, %d failed' % (len(summary) - len(failed), len(failed)))
+    if events.mode != "quiet":
+        for rel_fpath in failed:
+            print('\t[ failed ]', rel_fpath, ':', summary[rel_fpath])
+    if not failed and not pyc_persist and os.path.exists(srcdir):
         shutil.rmtree(srcdir)
 
 
-def unarchive_pyc(name, arch, outputdir, magic_int, type=None):
+def uncompyle_dir(srcdir, outputdir, pyc_persist, multiproc, cache=None, events=None, modules=None,
+                  magic_int=None, timeout=None):
+    """
+    Decompile the .pyc files below srcdir, or the in-memory modules (see
+    unarchive_pyi()) compiled for magic_int, into outputdir.
+    multiproc spreads the modules over a pool of cpu count workers, each
+    given at most timeout seconds per module.
+
+    Returns a dict mapping every module to its error, None on success.
+    """
+    if events is None:
+        events = EventStream()
+    jobs = decompile_jobs(srcdir, outputdir, cache, modules, magic_int)
+
+    def decompiled(job, result, seconds):
+        events.add("decompile", seconds, name=result[0], error=result[1])
+
+    if multiproc:
+        pool = WorkerPool(uncompyle_job, multiprocessing.cpu_count(), timeout=timeout,
+                          on_budget=lambda job, reason: (job[0], reason), on_done=decompiled)
+        summary = dict(pool.imap_unordered(jobs))
+    else:
+        summary = {}
+        for job in jobs:
+            started = clock()
+            result = uncompyle_job(job)
+            decompiled(job, result, clock() - started)
+            summary[result[0]] = result[1]
+    if cache is not None:
+        cache.prune()
+    report_decompiled(summary, srcdir, pyc_persist, events)
+    return summary
+
+
+def unarchive_pyc(name, arch, outputdir, magic_int, type=None, index=None, events=None, modules=None, path=None):
+    """
+    Write the entry name of arch below outputdir, at the relative path
+    given or one derived from name. Returns that path, None if nothing
+    was written.
+    """
     std_lib_pathes = [os.path.join(os.path.split(sys.executable)[0], x) for x in ('Lib', 'Lib/site-packages')]
     if name.startswith("future.") or name.startswith("__"):
         return
+    if events is None:
+        events = EventStream()
+    started = clock()
     data = get_data(name, arch)
+    events.add("decompress", clock() - started, len(data or b''), name)
     # data = asm_typecode(data, pyver, magic_int)
-    if type is None:
+    if path is not None:
+        name1 = path
+    elif type is None:
         name1 = name.replace(".", "/") + ".pyc"
     elif type not in ('x', 'b'):
         # data = asm_typecode(data, pyver, magic_int)
@@ -86,21 +362,28 @@ def unarchive_pyc(name, arch, outputdir, magic_int, type=None):
     else:
         name1 = name
 
-    tmp_fpath = os.path.join(outputdir, name + '.pyc')
     dst_fpath = os.path.join(outputdir, name1)
     if data[0] & 0x7f == ord('c'):
-        open(tmp_fpath, 'wb').write(data)
+        # unmarshalled straight from memory, the .pyc is written once below
         is_std = False
         try:
-            co = xdis.unmarshal.load_code(open(tmp_fpath, 'rb'), magic_int)
+            started = clock()
+            co = xdis.unmarshal.load_code(io.BytesIO(data), magic_int)
+            events.add("unmarshal", clock() - started, len(data), name1)
         except Exception as e:
             sys.stdout.write("xdis.unmarshal.load_code error: %s %s\n" % (name1, e))
-            is_std = True  # FIXME
         else:
-            print('\t', co.co_filename, name1)
-            if 'site-packages' in co.co_filename:
+            if events.active:
+                events.emit("module", name=name1, filename=co.co_filename)
+            if index is not None:
+                # known stdlib or third-party module
+                label = index.lookup(co, magics.int2magic(magic_int))
+                if label is not None:
+                    events.emit("known_module", name=name1, label=label)
+                    is_std = True
+            elif 'site-packages' in co.co_filename:
                 is_std = True
-            if not is_std:
+            if not is_std and index is None:
                 for bs in std_lib_pathes:
                     if os.path.exists(os.path.join(bs, name1[:-1])):
                         is_std = True
@@ -108,24 +391,44 @@ def unarchive_pyc(name, arch, outputdir, magic_int, type=None):
                     if os.path.exists(os.path.join(bs, name1[:-4])):
                         is_std = True
                         break
-            if not is_std:
+            if not is_std and modules is not None:
+                modules[name1] = data
+                return name1
+            elif not is_std:
                 directory, _ = os.path.split(dst_fpath)
                 if directory and not os.path.exists(directory):
                     os.makedirs(directory)
+                started = clock()
                 xdis_load.write_bytecode_file(dst_fpath, co, magic_int, len(data))
-        finally:
-            if is_std:
-                os.remove(tmp_fpath)
-            else:
-                if tmp_fpath != dst_fpath:
-                    os.remove(tmp_fpath)
+                events.add("write", clock() - started, len(data), name1)
+                return name1
     else:
         print('ERROR file format: %s', name)
+    return None
 
 
-def unarchive_pyi(arch, outputdir, pyver):
-    if not arch:
+def iter_archives(arch, events):
+    """
+    arch and every archive embedded in it, depth first.
+    """
+    yield arch
+    if isinstance(arch.toc, dict):
         return
+    for pos, length, uncompressed, iscompressed, type, name in arch.toc.data:
+        if type in ('z', 'Z', 'a'):
+            started = clock()
+            _arch = get_archive(name, parent=arch)
+            events.add("toc", clock() - started, name=name)
+            if _arch:
+                for x in iter_archives(_arch, events):
+                    yield x
+
+
+def toc_entries(arch):
+    """
+    (name, type, ispkg) of the entries of arch to unarchive, type is None
+    for the modules of a PYZ.
+    """
     # pyinstaller/bootloader/pyi_archive.h
     # /* Types of CArchive items. */
     # define ARCHIVE_ITEM_BINARY           'b'  /* binary */
@@ -137,30 +440,52 @@ def unarchive_pyi(arch, outputdir, pyver):
     # define ARCHIVE_ITEM_PYSOURCE         's'  /* Python script (v3) */
     # define ARCHIVE_ITEM_DATA             'x'  /* data */
     # define ARCHIVE_ITEM_RUNTIME_OPTION   'o'  /* runtime option */
-    magic_int = magics.magic2int(imp.get_magic())
     if isinstance(arch.toc, dict):
-        print(" Name: (ispkg, pos, len)")
-        show("", arch)
-        for name, _ in arch.toc.items():
-            unarchive_pyc(name, arch, outputdir, magic_int)
-    else:
-        print(" pos, length, uncompressed, iscompressed, type, name")
-        if outputdir and not os.path.exists(outputdir):
-            os.makedirs(outputdir)
-        for pos, length, uncompressed, iscompressed, type, name in arch.toc.data:
-            if name.startswith('pyimod0') or name.startswith('pyi_rth_'):
-                continue
-            if type in ('z', 'Z', 'a'):
-                data = get_data(name, arch)
-                dst_fpath = os.path.join(outputdir, name)
-                directory, _ = os.path.split(dst_fpath)
-                if directory and not os.path.exists(directory):
-                    os.makedirs(directory)
-                # open(dst_fpath, 'wb').write(data)
-                _arch = get_archive(name, parent=arch)
-                unarchive_pyi(_arch, outputdir, pyver)
-            else:
-                unarchive_pyc(name, arch, outputdir, magic_int, type=type)
+        for name, (ispkg, pos, length) in arch.toc.items():
+            yield name, None, ispkg == 1
+        return
+    for pos, length, uncompressed, iscompressed, type, name in arch.toc.data:
+        if name.startswith('pyimod0') or name.startswith('pyi_rth_') or type in ('z', 'Z', 'a'):
+            continue
+        yield name, type, type == 'M'
+
+
+def unarchive_pyi(arch, outputdir, pyver, index=None, events=None, modules=None):
+    """
+    Write the modules of arch and of the archives embedded in it below
+    outputdir as .pyc files, or with a modules dict collect their
+    marshalled code in it instead.
+
+    Where every module goes is planned from the TOCs before anything is
+    written (see plan_layout()): packages become <name>/__init__.pyc and
+    package directories without a module of their own get an empty
+    __init__.py.
+
+    Returns the relative paths of the modules written.
+    """
+    if not arch:
+        return []
+    if events is None:
+        events = EventStream()
+    magic_int = magics.magic2int(imp.get_magic())
+    archives = list(iter_archives(arch, events))
+    entries = [(_arch, name, type, ispkg) for _arch in archives for name, type, ispkg in toc_entries(_arch)]
+    layout = plan_layout((name, ispkg) for _arch, name, type, ispkg in entries if type not in ('x', 'b'))
+    if modules is None and outputdir and not os.path.exists(outputdir):
+        os.makedirs(outputdir)
+    for _arch in archives:
+        if isinstance(_arch.toc, dict):
+            show("", _arch, events)
+    written = []
+    for _arch, name, type, ispkg in entries:
+        path = unarchive_pyc(name, _arch, outputdir, magic_int, type=type, index=index, events=events,
+                             modules=modules, path=layout.get(name) if type not in ('x', 'b') else None)
+        if path is not None and type not in ('x', 'b'):
+            written.append(path)
+    if modules is None:
+        for directory in missing_packages(written):
+            open(os.path.join(outputdir, directory, '__init__.py'), 'w').close()
+    return written
 
 
 def get_archive(name, parent=None):
@@ -173,15 +498,38 @@ def get_archive(name, parent=None):
     except KeyError:
         return None
     except (ValueError, RuntimeError):
+        # compressed, it can not be opened in place: open it from memory
         ndx = parent.toc.find(name)
         dpos, dlen, ulen, flag, typcd, name = parent.toc[ndx]
         x, data = parent.extract(ndx)
-        tempfilename = tempfile.mktemp()
-        open(tempfilename, 'wb').write(data)
-        if typcd == 'z':
-            return ZlibArchive(tempfilename)
-        else:
-            return CArchiveReader(tempfilename)
+        return open_buffer(ZlibArchive if typcd == 'z' else CArchiveReader, name, data)
+
+
+class BufferFile(io.BytesIO):
+    """
+    In-memory stand-in for PyInstaller's ArchiveFile: the readers wrap every
+    access in 'with self.lib', which must neither reopen nor close it.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def open_buffer(archive_cls, name, data):
+    """
+    Open the archive held in the bytes data with archive_cls, a PyInstaller
+    archive reader, without going through a file.
+    """
+    # without a path the readers read nothing, the buffer is plugged in instead
+    arch = archive_cls(None)
+    arch.path = name
+    arch.lib = BufferFile(data)
+    arch.checkmagic()
+    arch.loadtoc()
+    return arch
 
 
 def get_data(name, arch):
@@ -198,14 +546,17 @@ def get_data(name, arch):
     return data
 
 
-def show(name, arch):
+def show(name, arch, events):
+    # one event per TOC entry, only built if someone listens
+    if not events.active:
+        return
     if isinstance(arch.toc, dict):
-        print(" Name: (ispkg, pos, len)")
-        toc = arch.toc
+        for nm, (ispkg, pos, length) in arch.toc.items():
+            events.emit("entry", archive=name, name=nm, ispkg=ispkg, pos=pos, length=length)
     else:
-        print(" pos, length, uncompressed, iscompressed, type, name")
-        toc = arch.toc.data
-    pprint.pprint(toc)
+        for pos, length, uncompressed, iscompressed, type, nm in arch.toc.data:
+            events.emit("entry", archive=name, name=nm, pos=pos, length=length, ulen=uncompressed,
+                        flag=iscompressed, typcd=type)
 
 
 class ZlibArchive(pyimod02_archive.ZlibArchiveReader):
@@ -226,7 +577,7 @@ class ZlibArchive(pyimod02_archive.ZlibArchiveReader):
 def run():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--persist-pyc',
-                        default=True,
+                        default=False,
                         action="store_true",
                         dest='pyc_persist',
                         help='Keep the .pyc file')
@@ -245,6 +596,43 @@ def run():
                         action="store",
                         dest='pyver',
                         help='python version: %s' % ",".join(sorted(list(magics.python_versions))))
+    parser.add_argument('-t', '--timeout',
+                        default=None,
+                        type=float,
+                        dest='timeout',
+                        help='seconds a module may take to decompile with --multiproc')
+    parser.add_argument('--cache-dir',
+                        default=None,
+                        action="store",
+                        dest='cache_dir',
+                        help='reuse decompiled sources of identical modules from this directory')
+    parser.add_argument('--cache-size',
+                        default=None,
+                        type=int,
+                        dest='cache_size',
+                        help='size bound of the decompile cache in MB')
+    parser.add_argument('--fingerprints',
+                        default=None,
+                        action="store",
+                        dest='fingerprints',
+                        help='fingerprint index of known stdlib/third-party modules to skip')
+    parser.add_argument('-b', '--batch',
+                        default=False,
+                        action="store_true",
+                        dest='batch',
+                        help='pyi_archive is a directory or a manifest file of binaries to unfreeze')
+    parser.add_argument('-p', '--progress',
+                        default=None,
+                        choices=MODES,
+                        dest='progress',
+                        help='progress output: quiet (default), a summary of the stage timers, '
+                             'or every event as JSON lines')
+    parser.add_argument('--events',
+                        default=None,
+                        action="store",
+                        metavar='FILE',
+                        dest='events_file',
+                        help='write the progress events as JSON lines to FILE')
     PyInstaller.log.__add_options(parser)
     parser.add_argument('name', metavar='pyi_archive',
                         help="pyinstaller archive to show content of")
@@ -252,10 +640,23 @@ def run():
     args = parser.parse_args()
     PyInstaller.log.__process_options(parser, args)
 
+    stream = open(args.events_file, 'w') if args.events_file else None
+    events = args.events = EventStream(args.progress or ("events" if stream else "quiet"), stream)
     try:
-        raise SystemExit(main(**vars(args)))
+        if args.batch:
+            options = vars(args)
+            # the flag itself would clash with main_batch()'s batch argument
+            options.pop('batch')
+            rc = main_batch(options.pop('name'), **options)
+        else:
+            rc = main(**vars(args))
     except KeyboardInterrupt:
         raise SystemExit("Aborted by user request.")
+    finally:
+        events.close()
+        if stream is not None:
+            stream.close()
+    raise SystemExit(rc)
 
 
 if __name__ == '__main__':